@@ -0,0 +1,181 @@
+"""
+Планы и время запросов лент до и после миграции posts.0004_feed_indexes.
+
+Создаёт отдельную базу SQLite, применяет миграции до 0003, заполняет её
+и замеряет запросы, затем применяет 0004 и повторяет замеры.
+
+    python benchmarks/feed_indexes.py --posts 1000000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+
+
+def setup_django(db_name):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = db_name
+    django.setup()
+
+
+def seed(options):
+    from django.db import connection, transaction
+
+    rng = random.Random(options.seed)
+    start = datetime(2020, 1, 1)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO auth_user (id, password, is_superuser, username, "
+            "first_name, last_name, email, is_staff, is_active, date_joined) "
+            "VALUES (%s, '', 0, %s, '', '', '', 0, 1, %s)",
+            [(pk, f"user_{pk}", start)
+             for pk in range(1, options.users + 1)]
+        )
+        cursor.executemany(
+            "INSERT INTO posts_group (id, title, slug, description) "
+            "VALUES (%s, %s, %s, '')",
+            [(pk, f"group {pk}", f"group-{pk}")
+             for pk in range(1, options.groups + 1)]
+        )
+        for offset in range(0, options.posts, 50000):
+            rows = []
+            last = min(offset + 50000, options.posts)
+            for pk in range(offset + 1, last + 1):
+                rows.append((
+                    pk,
+                    f"post {pk}",
+                    start + timedelta(seconds=pk * 7),
+                    rng.randint(1, options.groups),
+                    rng.randint(1, options.users),
+                ))
+            cursor.executemany(
+                "INSERT INTO posts_post "
+                "(id, text, pub_date, group_id, author_id, image, "
+                "comments_count) VALUES (%s, %s, %s, %s, %s, '', 0)",
+                rows
+            )
+        cursor.executemany(
+            "INSERT INTO posts_comment (post_id, author_id, text, created) "
+            "VALUES (%s, %s, 'comment', %s)",
+            [(rng.randint(1, options.posts), rng.randint(1, options.users),
+              start + timedelta(seconds=pk))
+             for pk in range(options.posts // 5)]
+        )
+        follows = {
+            (rng.randint(1, options.users), rng.randint(1, options.users))
+            for _ in range(options.users * 20)
+        }
+        cursor.executemany(
+            "INSERT INTO posts_follow (user_id, author_id) VALUES (%s, %s)",
+            [pair for pair in follows if pair[0] != pair[1]]
+        )
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def get_queries(options):
+    from posts.models import Post, Comment, Follow
+
+    # База остаётся на схеме 0003-0004, а модели - в текущей: запросы
+    # читают только столбцы, которые были уже тогда
+    posts = Post.objects.order_by("-pub_date").values_list(
+        "pk", "text", "pub_date", "author_id", "group_id"
+    )
+    comments = Comment.objects.order_by("-created").values_list(
+        "pk", "text", "created", "author_id"
+    )
+    rng = random.Random(options.seed + 1)
+    author = rng.randint(1, options.users)
+    group = rng.randint(1, options.groups)
+    post = rng.randint(1, options.posts)
+    return {
+        "profile": lambda: posts.filter(author_id=author)[:10],
+        "profile page 50": lambda: posts.filter(
+            author_id=author)[490:500],
+        "group": lambda: posts.filter(group_id=group)[:10],
+        "group page 50": lambda: posts.filter(
+            group_id=group)[490:500],
+        "comments": lambda: comments.filter(post_id=post),
+        "subscribers": lambda: Follow.objects.filter(
+            author_id=author).values("user_id"),
+    }
+
+
+def explain(queryset):
+    from django.db import connection
+
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def measure(queries, repeat):
+    results = {}
+    for name, build in queries.items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(build())
+            timings.append(time.perf_counter() - start)
+        results[name] = (statistics.median(timings), explain(build()))
+    return results
+
+
+def report(title, results):
+    print(f"\n== {title}")
+    for name, (median, plan) in results.items():
+        print(f"{name:<18} {median * 1000:9.3f} ms")
+        for line in plan:
+            print(f"{'':<20}{line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--db", help="файл базы (по умолчанию временный)")
+    options = parser.parse_args()
+
+    db_name = options.db or os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+    setup_django(db_name)
+
+    from django.core.management import call_command
+    from django.db import connection
+
+    call_command("migrate", "auth", verbosity=0)
+    call_command("migrate", "posts", "0003", verbosity=0)
+    start = time.perf_counter()
+    seed(options)
+    print(f"Seeded {options.posts} posts in "
+          f"{time.perf_counter() - start:.1f} s ({db_name})")
+
+    queries = get_queries(options)
+    before = measure(queries, options.repeat)
+    call_command("migrate", "posts", "0004", verbosity=0)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    after = measure(queries, options.repeat)
+
+    report("before posts.0004_feed_indexes", before)
+    report("after posts.0004_feed_indexes", after)
+    print("\n== speedup")
+    for name in queries:
+        print(f"{name:<18} x{before[name][0] / after[name][0]:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Объём изображений на странице ленты: одна миниатюра JPEG 960x339
+против вариантов из srcset (WebP с запасным JPEG).
+
+Создаёт отдельную базу SQLite и каталог media, заполняет их постами с
+изображениями, создаёт миниатюры и для нескольких экранов считает,
+сколько байт загрузит браузер, выбирая вариант из srcset.
+
+    python benchmarks/image_bytes.py --posts 30
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+from io import BytesIO
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+
+# (название, ширина карточки в CSS-пикселях, плотность пикселей)
+SCREENS = [
+    ("phone 360@3x", 360, 3),
+    ("phone 360@2x", 360, 2),
+    ("phone 360@1x", 360, 1),
+    ("tablet 768@2x", 510, 2),
+    ("desktop 1280@1x", 690, 1),
+    ("desktop 1920@2x", 690, 2),
+]
+
+
+def setup_django(directory):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = os.path.join(
+        directory, "bench.sqlite3"
+    )
+    settings.MEDIA_ROOT = os.path.join(directory, "media")
+    settings.CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache"
+        }
+    }
+    settings.POST_THUMBNAIL_WORKER_KIND = "sync"
+    django.setup()
+
+
+def make_image(rng, width, height):
+    # Градиент с шумом сжимается примерно как фотография
+    from PIL import Image, ImageFilter
+
+    noise = Image.effect_noise((width, height), rng.randint(20, 60))
+    gradient = Image.linear_gradient("L").resize((width, height))
+    image = Image.merge("RGB", (
+        noise,
+        gradient,
+        Image.blend(noise, gradient, rng.random()),
+    )).filter(ImageFilter.GaussianBlur(4))
+    buffer = BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def seed(options):
+    from django.contrib.auth import get_user_model
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from posts import thumbnails
+    from posts.models import Post
+
+    rng = random.Random(options.seed)
+    author = get_user_model().objects.create_user(username="bench")
+    for num in range(options.posts):
+        post = Post.objects.create(
+            text=f"post {num}",
+            author=author,
+            image=SimpleUploadedFile(
+                f"{num}.jpg", make_image(rng, 1920, 1280), "image/jpeg"
+            )
+        )
+        thumbnails.generate(post.image.name)
+
+
+def file_size(thumbnail):
+    # ImageFile.size - это размеры в пикселях, нужен размер файла
+    return thumbnail.storage.size(thumbnail.name)
+
+
+def choose(items, required):
+    # Как браузер выбирает из srcset с дескрипторами ширины: наименьший
+    # вариант, которого хватает на required пикселей, иначе наибольший
+    for width, thumbnail in items:
+        if width >= required:
+            return thumbnail
+    return items[-1][1]
+
+
+def variants_by_format(post):
+    from posts import thumbnails
+    from sorl.thumbnail import default
+
+    result = {}
+    for image_format, width, geometry, options in thumbnails.variants("card"):
+        thumbnail = default.kvstore.get(
+            thumbnails.thumbnail_file(post.image, geometry, **options)
+        )
+        result.setdefault(image_format, []).append((width, thumbnail))
+    return result
+
+
+def measure(page):
+    from posts import thumbnails
+
+    before = sum(
+        file_size(thumbnails.get_ready(post.image, "card")) for post in page
+    )
+    rows = []
+    for name, css_width, density in SCREENS:
+        required = css_width * density
+        totals = {}
+        for post in page:
+            for image_format, items in variants_by_format(post).items():
+                totals[image_format] = (
+                    totals.get(image_format, 0)
+                    + file_size(choose(items, required))
+                )
+        rows.append((name, totals))
+    return before, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--posts", type=int, default=30)
+    parser.add_argument("--page-size", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--dir", help="каталог для базы и media")
+    options = parser.parse_args()
+
+    directory = options.dir or tempfile.mkdtemp()
+    setup_django(directory)
+
+    from django.conf import settings
+    from django.core.management import call_command
+    from posts.models import Post
+
+    call_command("migrate", verbosity=0)
+    seed(options)
+    page = list(Post.objects.feed()[:options.page_size])
+    before, rows = measure(page)
+
+    print(f"Posts: {options.posts}, page: {len(page)} ({directory})")
+    print(f"\nbefore: one JPEG 960x339 card  {before / 1024:9.1f} KiB/page")
+    formats = settings.POST_THUMBNAIL_FORMATS
+    print(f"\n{'screen':<18}" + "".join(
+        f"{image_format + ' KiB':>12}" for image_format in formats
+    ) + f"{'saved':>9}")
+    for name, totals in rows:
+        best = totals[formats[0]]
+        print(f"{name:<18}" + "".join(
+            f"{totals[image_format] / 1024:12.1f}"
+            for image_format in formats
+        ) + f"{(1 - best / before) * 100:8.0f}%")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""
+Смешанная нагрузка на SQLite: --processes процессов по --threads потоков
+--duration секунд пишут посты и комментарии (доля --write-share) и читают
+ленту. Сравнивает стандартный бэкенд django.db.backends.sqlite3 с
+профилем yatube.db (WAL, PRAGMA, очередь на запись внутри процесса):
+записей в секунду, ошибок "database is locked" и перцентили чтения.
+
+    python benchmarks/sqlite_concurrency.py --processes 4 --threads 8
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+
+PROFILES = ("stock", "yatube")
+
+
+def setup_django(profile, name):
+    import django
+    from django.conf import settings
+
+    database = settings.DATABASES["default"]
+    database["NAME"] = name
+    if profile == "stock":
+        database["ENGINE"] = "django.db.backends.sqlite3"
+        database["OPTIONS"] = {}
+        database.pop("PRAGMAS", None)
+    settings.DATABASE_ROUTERS = []
+    settings.REPLICA_DATABASES = []
+    settings.CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+    }
+    settings.POST_THUMBNAIL_WORKER_KIND = "sync"
+    django.setup()
+
+
+def prepare(profile, name, users):
+    setup_django(profile, name)
+    from django.contrib.auth import get_user_model
+    from django.core.management import call_command
+    from posts.models import Post
+
+    call_command("migrate", verbosity=0)
+    User = get_user_model()
+    User.objects.bulk_create(
+        User(username=f"bench_{num}") for num in range(users)
+    )
+    Post.objects.bulk_create(
+        Post(author_id=pk, text="начальный пост")
+        for pk in User.objects.values_list("pk", flat=True)
+    )
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def worker(profile, name, options, seed, results):
+    setup_django(profile, name)
+    from django.contrib.auth import get_user_model
+    from django.db import OperationalError, connection
+    from posts.models import Comment, Post
+
+    authors = list(get_user_model().objects.values_list("pk", flat=True))
+    deadline = time.time() + options.duration
+    totals = {"writes": 0, "locked": 0, "reads": []}
+    totals_lock = threading.Lock()
+
+    def loop(num):
+        rng = random.Random(seed * 1000 + num)
+        writes = locked = 0
+        reads = []
+        while time.time() < deadline:
+            try:
+                if rng.random() < options.write_share:
+                    if rng.random() < 0.5:
+                        Post.objects.create(
+                            author_id=rng.choice(authors), text="пост"
+                        )
+                    else:
+                        post = Post.objects.order_by("-pk").first()
+                        Comment.objects.create(
+                            post=post, author_id=rng.choice(authors),
+                            text="комментарий"
+                        )
+                    writes += 1
+                else:
+                    start = time.perf_counter()
+                    list(
+                        Post.objects.select_related("author", "group")
+                        .order_by("-pub_date")[:10]
+                    )
+                    reads.append((time.perf_counter() - start) * 1000)
+            except OperationalError as error:
+                if "locked" not in str(error):
+                    raise
+                locked += 1
+        connection.close()
+        with totals_lock:
+            totals["writes"] += writes
+            totals["locked"] += locked
+            totals["reads"] += reads
+
+    threads = [
+        threading.Thread(target=loop, args=(num,))
+        for num in range(options.threads)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put(totals)
+
+
+def run(profile, options, directory):
+    name = os.path.join(directory, f"{profile}.sqlite3")
+    context = multiprocessing.get_context("spawn")
+    setup = context.Process(
+        target=prepare, args=(profile, name, options.users)
+    )
+    setup.start()
+    setup.join()
+
+    results = context.Queue()
+    processes = [
+        context.Process(
+            target=worker, args=(profile, name, options, num, results)
+        )
+        for num in range(options.processes)
+    ]
+    for process in processes:
+        process.start()
+    totals = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    reads = [value for total in totals for value in total["reads"]]
+    writes = sum(total["writes"] for total in totals)
+    return {
+        "writes_per_s": writes / options.duration,
+        "locked": sum(total["locked"] for total in totals),
+        "reads": len(reads),
+        "read_p50": percentile(reads, 0.50) if reads else 0,
+        "read_p95": percentile(reads, 0.95) if reads else 0,
+        "read_p99": percentile(reads, 0.99) if reads else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--write-share", type=float, default=0.2)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument(
+        "--profiles", nargs="+", choices=PROFILES, default=PROFILES
+    )
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    print(f"{options.processes} процессов x {options.threads} потоков, "
+          f"{options.duration:g} с, доля записи {options.write_share:g}")
+    print(f"{'profile':<9}{'writes/s':>10}{'locked':>8}{'reads':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for profile in options.profiles:
+        result = run(profile, options, directory)
+        print(f"{profile:<9}{result['writes_per_s']:10.0f}"
+              f"{result['locked']:8}{result['reads']:8}"
+              f"{result['read_p50']:9.2f}{result['read_p95']:9.2f}"
+              f"{result['read_p99']:9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Нагрузочный замер страниц через тестовый клиент Django.
+
+Для каждого сценария (index, group_posts, profile, post, follow_index,
+new_post, add_comment) выполняет --requests запросов и записывает в JSON
+перцентили времени ответа и число SQL-запросов. Базу заполняет командой
+seed_data, если не передана готовая (--db).
+
+    python benchmarks/views.py --output baseline.json
+    python benchmarks/views.py --compare baseline.json --fail-over 20
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BASE_DIR)
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "yatube.settings")
+
+SCENARIOS = (
+    "index", "group_posts", "profile", "post", "follow_index",
+    "new_post", "add_comment",
+)
+
+
+def setup_django(options, directory):
+    import django
+    from django.conf import settings
+
+    settings.DATABASES["default"]["NAME"] = options.db or os.path.join(
+        directory, "bench.sqlite3"
+    )
+    settings.MEDIA_ROOT = os.path.join(directory, "media")
+    settings.DEBUG = False
+    settings.ALLOWED_HOSTS = ["*"]
+    settings.POST_THUMBNAIL_WORKER_KIND = "sync"
+    if options.no_cache:
+        settings.CACHES = {
+            "default": {
+                "BACKEND": "django.core.cache.backends.dummy.DummyCache"
+            }
+        }
+    django.setup()
+    # Превышения бюджетов запросов здесь ожидаемы и только мешают выводу
+    logging.getLogger("yatube.metrics").setLevel(logging.ERROR)
+
+
+def seed(options):
+    from django.core.management import call_command
+
+    call_command("migrate", verbosity=0)
+    call_command(
+        "seed_data",
+        users=options.users,
+        groups=options.groups,
+        posts=options.posts,
+        comments=options.comments,
+        images=options.images,
+        seed=options.seed,
+    )
+
+
+def build_scenarios(rng):
+    # Адреса выбираются заранее, с перекосом в сторону популярного:
+    # так же распределены запросы живых пользователей
+    from django.contrib.auth import get_user_model
+    from django.db.models import Count
+    from django.urls import reverse
+    from posts.models import Post, Group
+
+    User = get_user_model()
+    authors = list(
+        User.objects.order_by("-stats__followers_count")
+        .values_list("username", flat=True)[:50]
+    )
+    groups = list(
+        Group.objects.annotate(total=Count("posts")).order_by("-total")
+        .values_list("slug", flat=True)[:20]
+    )
+    posts = list(
+        Post.objects.order_by("-comments_count")
+        .values_list("author__username", "pk")[:200]
+    )
+    reader = (
+        User.objects.order_by("-stats__following_count").first()
+    )
+
+    def pick(items):
+        return items[min(int(rng.expovariate(0.2)), len(items) - 1)]
+
+    def page():
+        return {"page": pick([1, 1, 1, 2, 3, 10])}
+
+    def post_url(kind):
+        username, pk = pick(posts)
+        return reverse(kind, kwargs={"username": username, "post_id": pk})
+
+    return reader, {
+        "index": lambda: ("get", reverse("index"), page(), False),
+        "group_posts": lambda: (
+            "get",
+            reverse("group_posts", kwargs={"slug": pick(groups)}),
+            page(), False
+        ),
+        "profile": lambda: (
+            "get",
+            reverse("profile", kwargs={"username": pick(authors)}),
+            page(), False
+        ),
+        "post": lambda: ("get", post_url("post"), {}, False),
+        "follow_index": lambda: (
+            "get", reverse("follow_index"), page(), True
+        ),
+        "new_post": lambda: (
+            "post", reverse("new_post"),
+            {"text": f"benchmark post {rng.random()}"}, True
+        ),
+        "add_comment": lambda: (
+            "post", post_url("add_comment"),
+            {"text": f"benchmark comment {rng.random()}"}, True
+        ),
+    }
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)]
+
+
+def run(name, build, reader, options):
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+
+    client = Client()
+    timings = []
+    queries = []
+    statuses = {}
+    for num in range(options.warmup + options.requests):
+        method, url, data, login = build()
+        if login:
+            client.force_login(reader)
+        else:
+            client.logout()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            if response.streaming:
+                b"".join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if num < options.warmup:
+            continue
+        timings.append(elapsed * 1000)
+        queries.append(len(captured.captured_queries))
+        code = str(response.status_code)
+        statuses[code] = statuses.get(code, 0) + 1
+    return {
+        "requests": len(timings),
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "mean_ms": round(statistics.mean(timings), 3),
+        "queries_p50": percentile(queries, 0.50),
+        "queries_max": max(queries),
+        "statuses": statuses,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, fail_over):
+    # Печатает изменения относительно baseline; возвращает True, если
+    # p95 какого-то сценария вырос больше чем на fail_over процентов
+    print(f"\n{'view':<14}{'p95 before':>12}{'p95 after':>12}"
+          f"{'change':>9}{'queries':>12}")
+    failed = False
+    for name, after in results["views"].items():
+        before = baseline["views"].get(name)
+        if before is None:
+            continue
+        change = (after["p95_ms"] / before["p95_ms"] - 1) * 100
+        queries = f"{before['queries_p50']}->{after['queries_p50']}"
+        mark = ""
+        if fail_over is not None and change > fail_over:
+            failed = True
+            mark = "  !"
+        print(f"{name:<14}{before['p95_ms']:12.2f}{after['p95_ms']:12.2f}"
+              f"{change:+8.0f}%{queries:>12}{mark}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db", help="готовая база (по умолчанию seed_data)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--posts", type=int, default=20000)
+    parser.add_argument("--comments", type=int, default=40000)
+    parser.add_argument("--images", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--views", nargs="+", choices=SCENARIOS, default=SCENARIOS
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="отключить кэш, чтобы мерить сами запросы к базе"
+    )
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    parser.add_argument("--compare", help="JSON предыдущего замера")
+    parser.add_argument(
+        "--fail-over", type=float,
+        help="код выхода 1, если p95 вырос больше чем на столько процентов"
+    )
+    options = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    setup_django(options, directory)
+    if not options.db:
+        start = time.perf_counter()
+        seed(options)
+        print(f"Seeded in {time.perf_counter() - start:.1f} s ({directory})")
+
+    rng = random.Random(options.seed)
+    reader, scenarios = build_scenarios(rng)
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "dataset": {
+            "db": options.db,
+            "users": options.users,
+            "groups": options.groups,
+            "posts": options.posts,
+            "comments": options.comments,
+            "images": options.images,
+            "seed": options.seed,
+        },
+        "cache": not options.no_cache,
+        "views": {},
+    }
+    print(f"{'view':<14}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'queries':>9}")
+    for name in options.views:
+        result = run(name, scenarios[name], reader, options)
+        results["views"][name] = result
+        print(f"{name:<14}{result['p50_ms']:9.2f}{result['p95_ms']:9.2f}"
+              f"{result['p99_ms']:9.2f}{result['queries_p50']:9}")
+
+    if options.output:
+        with open(options.output, "w") as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if options.compare:
+        with open(options.compare) as source:
+            baseline = json.load(source)
+        if compare(results, baseline, options.fail_over):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
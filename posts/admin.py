@@ -1,11 +1,23 @@
 from django.contrib import admin
 
+from . import search
 from .models import Post, Group, Comment
 
 
-class PostAdmin(admin.ModelAdmin):
+class FullTextSearchMixin:
+    # Поиск в списке объектов через индекс FTS5 вместо LIKE '%term%'
+    search_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return search.search(queryset, self.search_index, search_term), False
+
+
+class PostAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ("pk", "text", "pub_date", "author", "group")
     search_fields = ("text",)
+    search_index = "post"
     list_filter = ("pub_date",)
     empty_value_display = "-пусто-"
 
@@ -16,9 +28,10 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ("pk", "text", "created", "author", "post")
     search_fields = ("text",)
+    search_index = "comment"
     list_filter = ("created",)
     empty_value_display = "-пусто-"
 
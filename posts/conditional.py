@@ -0,0 +1,135 @@
+"""
+Условный GET для страниц ленты, группы, профиля и поста.
+
+ETag складывается из версий posts.versions, от которых зависит страница,
+Last-Modified - из времени их последнего изменения (пока не кончилась
+секунда последнего изменения, только ETag). Оба проверяются до
+запросов ленты и шаблона: неизменившаяся страница стоит несколько
+обращений к кэшу и отдаётся ответом 304. Без общего кэша (SHARED_CACHE)
+версии у каждого процесса свои и живут VERSION_CACHE_TIMEOUT секунд:
+дольше процесс, не видевший изменения, 304 не отвечает.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.cache import (
+    get_conditional_response, patch_cache_control, patch_vary_headers,
+    quote_etag
+)
+from django.utils.http import http_date
+
+from .models import Group, Post
+from .versions import get_modified, get_versions, modified_key, version_key
+
+User = get_user_model()
+
+
+def index_stamps():
+    return [("global",)]
+
+
+# Версии "groups" и "users" меняются, когда адрес может начать указывать
+# на другой объект: группа или пользователь с тем же именем удалены и
+# созданы заново
+def group_stamps(slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        "pk", flat=True
+    ).first()
+    if group_id is None:
+        return None
+    return [("group", group_id), ("groups",)]
+
+
+def profile_stamps(username):
+    author_id = User.objects.filter(username=username).values_list(
+        "pk", flat=True
+    ).first()
+    if author_id is None:
+        return None
+    return [("author", author_id), ("users",)]
+
+
+def post_stamps(username, post_id):
+    # Версия автора - для его карточки с числом постов и подписчиков
+    author_id = Post.objects.filter(
+        pk=post_id, author__username=username
+    ).values_list("author_id", flat=True).first()
+    if author_id is None:
+        return None
+    return [("post", post_id), ("author", author_id)]
+
+
+def get_stamps(request, stamps):
+    # Для пользователя страница зависит ещё от его подписок и
+    # CSRF-токена в формах, а время изменения не учитывает ни то, ни
+    # другое: Last-Modified отдаётся только анонимным
+    keys = [version_key(*parts) for parts in stamps]
+    user = request.user
+    if user.is_authenticated:
+        keys.append(version_key("follow", user.pk))
+    versions = dict(zip(keys, get_versions(*keys)))
+    values = [str(version) for version in versions.values()]
+    if user.is_authenticated:
+        values += [str(user.pk), request.META.get("CSRF_COOKIE", "")]
+        last_modified = None
+    else:
+        # If-Modified-Since сравнивается с точностью до секунды: второе
+        # изменение в ту же секунду не сдвинуло бы дату, и клиент получил
+        # бы 304 по устаревшей копии. Поэтому дата отдаётся, только когда
+        # секунда последнего изменения уже прошла
+        modified = int(get_modified(
+            *(modified_key(*parts) for parts in stamps)
+        ))
+        last_modified = modified if modified < int(time.time()) else None
+    etag = hashlib.md5("-".join(values).encode()).hexdigest()
+    return quote_etag(etag), last_modified, versions
+
+
+def set_cache_headers(request, response, etag, last_modified):
+    response["ETag"] = etag
+    if last_modified is not None:
+        response["Last-Modified"] = http_date(last_modified)
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        # Браузер каждый раз переспрашивает сервер, а прокси может
+        # PAGE_PROXY_MAX_AGE секунд отдавать страницу сам
+        patch_cache_control(
+            response, public=True, max_age=0,
+            s_maxage=settings.PAGE_PROXY_MAX_AGE
+        )
+    patch_vary_headers(response, ("Cookie",))
+
+
+def conditional_page(get_stamps_list):
+    """
+    Отвечает 304 на If-None-Match/If-Modified-Since, если не изменилась
+    ни одна из версий get_stamps_list(**kwargs). Функция получает
+    аргументы view и возвращает None, если объекта нет: тогда 404
+    отдаёт сама view.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(request, *args, **kwargs)
+            stamps = get_stamps_list(*args, **kwargs)
+            if stamps is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified, versions = get_stamps(request, stamps)
+            # По этим версиям posts.pagecache проверяет сохранённую копию
+            request.page_versions = versions
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified
+            )
+            if response is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+            set_cache_headers(request, response, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Post, Comment, Follow, UserStats
+
+User = get_user_model()
+
+
+def get_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        stats, _ = UserStats.objects.get_or_create(user=user)
+        return stats
+
+
+def _shift(field, delta):
+    return Greatest(F(field) + delta, Value(0))
+
+
+def change_user_counters(user_id, **deltas):
+    changes = {field: _shift(field, delta) for field, delta in deltas.items()}
+    updated = UserStats.objects.filter(user_id=user_id).update(**changes)
+    # При удалении пользователя строки счётчиков уже может не быть,
+    # создавать её заново нужно только при увеличении
+    if not updated and any(delta > 0 for delta in deltas.values()):
+        UserStats.objects.get_or_create(user_id=user_id)
+        UserStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def change_comments_count(post_id, delta):
+    Post.objects.filter(pk=post_id).update(
+        comments_count=_shift("comments_count", delta)
+    )
+
+
+def _count(queryset, field):
+    # Подзапрос COUNT(*) по внешнему ключу field для UPDATE ... SET
+    subquery = (
+        queryset.filter(**{field: OuterRef("pk")})
+        .order_by()
+        .values(field)
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    return Coalesce(Subquery(subquery), Value(0))
+
+
+def reconcile():
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk) for pk in
+         User.objects.filter(stats=None).values_list("pk", flat=True)),
+        ignore_conflicts=True
+    )
+    users = UserStats.objects.update(
+        posts_count=_count(Post.objects, "author"),
+        followers_count=_count(Follow.objects, "author"),
+        following_count=_count(Follow.objects, "user")
+    )
+    posts = Post.objects.update(
+        comments_count=_count(Comment.objects, "post")
+    )
+    return users, posts
@@ -0,0 +1,92 @@
+import csv
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Post, Comment
+
+# Вид выгрузки: модель, выгружаемые поля и поля фильтров автора и группы.
+# Строки читаются через values_list().iterator(): объекты моделей не
+# создаются, и в памяти находится не больше EXPORT_CHUNK_SIZE строк
+KINDS = {
+    "posts": {
+        "model": Post,
+        "fields": (
+            ("id", "id"),
+            ("author", "author__username"),
+            ("group", "group__slug"),
+            ("text", "text"),
+            ("pub_date", "pub_date"),
+            ("image", "image"),
+            ("comments_count", "comments_count"),
+        ),
+        "author": "author__username",
+        "group": "group__slug",
+    },
+    "comments": {
+        "model": Comment,
+        "fields": (
+            ("id", "id"),
+            ("post", "post_id"),
+            ("author", "author__username"),
+            ("text", "text"),
+            ("created", "created"),
+        ),
+        "author": "author__username",
+        "group": "post__group__slug",
+    },
+}
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv", "csv"),
+}
+
+
+def get_queryset(kind, author=None, group=None):
+    spec = KINDS[kind]
+    queryset = spec["model"].objects.order_by("pk")
+    if author:
+        queryset = queryset.filter(**{spec["author"]: author})
+    if group:
+        queryset = queryset.filter(**{spec["group"]: group})
+    return queryset
+
+
+def get_rows(kind, queryset):
+    columns = [column for _, column in KINDS[kind]["fields"]]
+    return queryset.values_list(*columns).iterator(
+        chunk_size=settings.EXPORT_CHUNK_SIZE
+    )
+
+
+class Echo:
+    # csv.writer пишет в объект с методом write; строка сразу отдаётся
+    def write(self, value):
+        return value
+
+
+def to_ndjson(names, rows):
+    for row in rows:
+        yield json.dumps(
+            dict(zip(names, row)), cls=DjangoJSONEncoder, ensure_ascii=False
+        ) + "\n"
+
+
+def to_csv(names, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(names)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export(kind, queryset, export_format):
+    """
+    Генератор строк выгрузки kind ("posts" или "comments") в формате
+    "ndjson" или "csv"
+    """
+    names = [name for name, _ in KINDS[kind]["fields"]]
+    rows = get_rows(kind, queryset)
+    if export_format == "csv":
+        return to_csv(names, rows)
+    return to_ndjson(names, rows)
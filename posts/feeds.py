@@ -0,0 +1,144 @@
+import copy
+import mimetypes
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.shortcuts import get_current_site
+from django.contrib.syndication.views import Feed, add_domain
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+
+from .models import Post, Group
+
+User = get_user_model()
+
+
+class PostsFeed(Feed):
+    """
+    Последние SYNDICATION_ITEMS постов через Post.objects.feed(): объект
+    ленты и сами посты - по одному запросу при любом числе записей.
+    """
+
+    def __call__(self, request, *args, **kwargs):
+        # Один экземпляр ленты обслуживает все запросы, поэтому запрос
+        # для абсолютных ссылок запоминается в копии
+        feed = copy.copy(self)
+        feed.request = request
+        return super(PostsFeed, feed).__call__(request, *args, **kwargs)
+
+    def absolute_url(self, url):
+        # Как ссылки на сами записи у Feed: с доменом текущего сайта
+        return add_domain(
+            get_current_site(self.request).domain,
+            url,
+            self.request.is_secure()
+        )
+
+    def get_posts(self, obj):
+        return Post.objects.feed()
+
+    def items(self, obj):
+        return self.get_posts(obj).order_by(
+            "-pub_date", "-pk"
+        )[:settings.SYNDICATION_ITEMS]
+
+    def item_title(self, item):
+        return Truncator(item.text).words(10)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse("post", kwargs={
+            "username": item.author.username, "post_id": item.pk
+        })
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_author_link(self, item):
+        return self.absolute_url(
+            reverse("profile", kwargs={"username": item.author.username})
+        )
+
+    def item_categories(self, item):
+        if item.group is not None:
+            return [item.group.title]
+        return []
+
+    def item_enclosure_url(self, item):
+        if item.image:
+            return self.absolute_url(item.image.url)
+        return None
+
+    def item_enclosure_length(self, item):
+        return item.image_size or 0
+
+    def item_enclosure_mime_type(self, item):
+        return mimetypes.guess_type(item.image.name)[0] or "image/jpeg"
+
+
+class IndexFeed(PostsFeed):
+    title = "Yatube: последние записи"
+    description = "Новые записи всех авторов"
+
+    def link(self):
+        return reverse("index")
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_object_or_404(Group, slug=slug)
+
+    def get_posts(self, obj):
+        return obj.posts.feed()
+
+    def title(self, obj):
+        return f"Yatube: {obj.title}"
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse("group_posts", kwargs={"slug": obj.slug})
+
+
+class ProfileFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_object_or_404(User, username=username)
+
+    def get_posts(self, obj):
+        return obj.posts.feed()
+
+    def title(self, obj):
+        return f"Yatube: {obj.get_full_name() or obj.username}"
+
+    def description(self, obj):
+        return f"Записи пользователя {obj.username}"
+
+    def link(self, obj):
+        return reverse("profile", kwargs={"username": obj.username})
+
+
+class AtomIndexFeed(IndexFeed):
+    feed_type = Atom1Feed
+    subtitle = IndexFeed.description
+
+
+class AtomGroupFeed(GroupFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
+
+
+class AtomProfileFeed(ProfileFeed):
+    feed_type = Atom1Feed
+
+    def subtitle(self, obj):
+        return self.description(obj)
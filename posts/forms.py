@@ -1,10 +1,19 @@
+from django.core.files.uploadedfile import UploadedFile
 from django.forms import ModelForm
 from django.utils.translation import gettext_lazy as _
 
+from .ingest import ingest
 from .models import Post, Comment
 
 
 class PostForm(ModelForm):
+    def clean_image(self):
+        image = self.cleaned_data.get("image")
+        if isinstance(image, UploadedFile):
+            field = Post._meta.get_field("image")
+            return ingest(image, field.storage, field.upload_to)
+        return image
+
     class Meta:
         model = Post
         fields = ["text", "group", 'image']
@@ -0,0 +1,335 @@
+import json
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.utils import timezone
+
+from . import counters, search, timeline
+from .models import Post, Group, Comment, Follow, ImportState
+from .paginators import count_cache_key
+from .versions import bump_version
+
+User = get_user_model()
+
+# Порядок записи внутри порции: сначала то, на что ссылаются остальные
+TYPES = ("user", "group", "post", "comment", "follow")
+# SQLite ограничивает число параметров запроса (999 в старых версиях)
+IN_BATCH_SIZE = 900
+DECODER = json.JSONDecoder()
+
+
+def select_in(queryset, lookup, values):
+    # queryset.filter(<lookup>__in=values) частями по IN_BATCH_SIZE
+    values = list(values)
+    for start in range(0, len(values), IN_BATCH_SIZE):
+        yield from queryset.filter(
+            **{f"{lookup}__in": values[start:start + IN_BATCH_SIZE]}
+        )
+
+
+def prepare_datetime(value, adapt):
+    # Дата из ISO 8601 в том виде, в каком её ждёт база. get_db_prep_save
+    # поля делает то же через pytz и занимал больше трети времени на строку.
+    # База хранит время в UTC (TIME_ZONE в DATABASES не задан)
+    if value.endswith("Z"):
+        # Уже UTC - так пишет даты export_posts
+        value = datetime.fromisoformat(value[:-1])
+    else:
+        value = datetime.fromisoformat(value)
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value)
+        value = value.astimezone(dt_timezone.utc).replace(tzinfo=None)
+    return adapt(value)
+
+
+def decode_lines(lines):
+    # Строки порции разбираются одним вызовом декодера как JSON-массив,
+    # без вызова из Python на каждую строку. NDJSON всегда в UTF-8
+    return DECODER.decode((b"[" + b",".join(lines) + b"]").decode())
+
+
+class Importer:
+    """
+    Загрузка NDJSON: по объекту на строку, вид объекта в поле "type".
+    Строки читаются порциями по chunk_size, каждая порция записывается
+    в своей транзакции пачками по batch_size: пользователи и группы через
+    bulk_create, посты, комментарии и подписки - одним подготовленным
+    INSERT через executemany.
+    Пользователи и группы ищутся по username и slug в словарях в памяти,
+    посты и комментарии сохраняют id из выгрузки. Позиция загрузки
+    (write_state) пишется в транзакции порции: после сбоя порция либо
+    записана вместе с позицией, либо не записана вовсе, и строки без id
+    не загружаются дважды.
+    """
+
+    def __init__(self, batch_size=1000, chunk_size=50000, default_type=None):
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.default_type = default_type
+        self.users = dict(User.objects.values_list("username", "pk"))
+        self.groups = dict(Group.objects.values_list("slug", "pk"))
+        # Для SQLite adapt_datetimefield_value наивной даты - это str(),
+        # только с проверками на каждую строку
+        if connection.vendor == "sqlite":
+            self.adapt_datetime = str
+        else:
+            self.adapt_datetime = connection.ops.adapt_datetimefield_value
+        self.loaded = dict.fromkeys(TYPES, 0)
+        # id постов, уже записанных этой загрузкой: комментарии к ним
+        # не нужно проверять запросом
+        self.post_ids = set()
+        self.skipped = 0
+        # Чьи кэшированные страницы нужно сбросить после загрузки
+        self.authors = set()
+        self.followers = set()
+        self.commented = set()
+
+    @contextmanager
+    def bulk_load(self):
+        """
+        Для SQLite на время загрузки выключает fsync (synchronous = OFF)
+        и проверку внешних ключей: ссылки строк загрузчик проверяет сам.
+        Схема не меняется, поэтому прерванная загрузка ничего не
+        оставляет сломанным. Без fsync сбой ОС может потерять последние
+        порции, но вместе с их позицией: следующий запуск их повторит.
+        """
+        # Внутри транзакции SQLite эти PRAGMA менять не даёт
+        pragmas = (
+            connection.vendor == "sqlite" and not connection.in_atomic_block
+        )
+        if pragmas:
+            with connection.cursor() as cursor:
+                cursor.execute("PRAGMA synchronous = OFF")
+                cursor.execute("PRAGMA foreign_keys = OFF")
+        try:
+            yield self
+        finally:
+            if pragmas:
+                synchronous = connection.settings_dict.get(
+                    "PRAGMAS", {}
+                ).get("synchronous", "FULL")
+                with connection.cursor() as cursor:
+                    cursor.execute(f"PRAGMA synchronous = {synchronous}")
+                    cursor.execute("PRAGMA foreign_keys = ON")
+
+    def read_chunks(self, file_, offset):
+        # Порции строк и смещение в байтах после каждой порции
+        file_.seek(offset)
+        lines = []
+        for line in file_:
+            offset += len(line)
+            if line.strip():
+                lines.append(line)
+            if len(lines) >= self.chunk_size:
+                yield decode_lines(lines), offset
+                lines = []
+        if lines:
+            yield decode_lines(lines), offset
+
+    def load_chunk(self, rows):
+        by_type = {kind: [] for kind in TYPES}
+        for row in rows:
+            kind = row.pop("type", self.default_type)
+            if kind not in by_type:
+                self.skipped += 1
+                continue
+            by_type[kind].append(row)
+        with transaction.atomic():
+            for kind in TYPES:
+                if by_type[kind]:
+                    getattr(self, f"load_{kind}s")(by_type[kind])
+
+    def create(self, kind, model, objects):
+        # Явный batch_size в Django 2.2 не ограничивается пределом базы
+        # на число параметров - ограничиваем сами
+        limit = connection.ops.bulk_batch_size(
+            model._meta.concrete_fields, objects
+        )
+        model.objects.bulk_create(
+            objects,
+            batch_size=min(self.batch_size, limit),
+            ignore_conflicts=True
+        )
+        self.loaded[kind] += len(objects)
+
+    def load_users(self, rows):
+        new = [row for row in rows if row["username"] not in self.users]
+        self.skipped += len(rows) - len(new)
+        now = self.adapt_datetime(
+            timezone.now().astimezone(dt_timezone.utc).replace(tzinfo=None)
+        )
+        self.insert("user", User, (
+            "username", "email", "first_name", "last_name", "date_joined",
+            "password"
+        ), [
+            (
+                row["username"],
+                row.get("email", ""),
+                row.get("first_name", ""),
+                row.get("last_name", ""),
+                prepare_datetime(row["date_joined"], self.adapt_datetime)
+                if row.get("date_joined") else now,
+                UNUSABLE_PASSWORD_PREFIX,
+            )
+            for row in new
+        ])
+        self.users.update(select_in(
+            User.objects.values_list("username", "pk"),
+            "username", {row["username"] for row in new}
+        ))
+
+    def load_groups(self, rows):
+        new = [row for row in rows if row["slug"] not in self.groups]
+        self.skipped += len(rows) - len(new)
+        self.create("group", Group, [
+            Group(
+                slug=row["slug"],
+                title=row.get("title") or row["slug"],
+                description=row.get("description", ""),
+            )
+            for row in new
+        ])
+        self.groups.update(select_in(
+            Group.objects.values_list("slug", "pk"),
+            "slug", {row["slug"] for row in new}
+        ))
+
+    def insert(self, kind, model, names, rows):
+        # Аналог bulk_create(ignore_conflicts=True) без создания объектов
+        # модели и компиляции запроса на каждые ~100 строк. Поля, которых
+        # нет в names, получают значения по умолчанию
+        given = [model._meta.get_field(name) for name in names]
+        rest = [
+            field for field in model._meta.concrete_fields
+            if field not in given and not isinstance(field, models.AutoField)
+        ]
+        defaults = tuple(
+            field.get_db_prep_save(field.get_default(), connection)
+            for field in rest
+        )
+        ops = connection.ops
+        sql = "{} {} ({}) VALUES ({}) {}".format(
+            ops.insert_statement(ignore_conflicts=True),
+            ops.quote_name(model._meta.db_table),
+            ", ".join(ops.quote_name(field.column) for field in given + rest),
+            ", ".join(["%s"] * (len(given) + len(rest))),
+            ops.ignore_conflicts_suffix_sql(ignore_conflicts=True),
+        )
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(sql, [
+                    row + defaults
+                    for row in rows[start:start + self.batch_size]
+                ])
+        self.loaded[kind] += len(rows)
+
+    def insert_keeping_ids(self, kind, model, names, rows):
+        # rows начинаются с id из выгрузки; строки без id получают новый
+        self.insert(
+            kind, model, ("id",) + names,
+            [row for row in rows if row[0] is not None]
+        )
+        self.insert(
+            kind, model, names, [row[1:] for row in rows if row[0] is None]
+        )
+
+    def load_posts(self, rows):
+        posts = []
+        for row in rows:
+            author_id = self.users.get(row["author"])
+            group = row.get("group")
+            if author_id is None or (group and group not in self.groups):
+                self.skipped += 1
+                continue
+            self.authors.add(author_id)
+            posts.append((
+                row.get("id"),
+                row["text"],
+                prepare_datetime(row["pub_date"], self.adapt_datetime),
+                author_id,
+                self.groups.get(group),
+                row.get("image") or "",
+            ))
+        self.insert_keeping_ids("post", Post, (
+            "text", "pub_date", "author", "group", "image"
+        ), posts)
+        self.post_ids.update(post[0] for post in posts if post[0] is not None)
+
+    def load_comments(self, rows):
+        post_ids = self.post_ids
+        post_ids.update(select_in(
+            Post.objects.values_list("pk", flat=True),
+            "pk", {row["post"] for row in rows} - post_ids
+        ))
+        comments = []
+        for row in rows:
+            author_id = self.users.get(row["author"])
+            if author_id is None or row["post"] not in post_ids:
+                self.skipped += 1
+                continue
+            comments.append((
+                row.get("id"),
+                row["post"],
+                author_id,
+                row["text"],
+                prepare_datetime(row["created"], self.adapt_datetime),
+            ))
+            self.commented.add(row["post"])
+        self.insert_keeping_ids("comment", Comment, (
+            "post", "author", "text", "created"
+        ), comments)
+
+    def load_follows(self, rows):
+        follows = []
+        for row in rows:
+            user_id = self.users.get(row["user"])
+            author_id = self.users.get(row["author"])
+            if user_id is None or author_id is None or user_id == author_id:
+                self.skipped += 1
+                continue
+            self.followers.add(user_id)
+            follows.append((user_id, author_id))
+        self.insert("follow", Follow, ("user", "author"), follows)
+
+    def finalize(self):
+        # Сигналы при загрузке не вызываются: всё, что они поддерживают,
+        # пересчитывается один раз для всей загрузки
+        counters.reconcile()
+        if search.is_available():
+            search.rebuild("post", Post.objects.all(), self.batch_size)
+            search.rebuild("comment", Comment.objects.all(), self.batch_size)
+        timeline.rebuild()
+        cache.delete_many([count_cache_key("index")] + [
+            count_cache_key("group", pk) for pk in self.groups.values()
+        ])
+        bump_version("global")
+        bump_version("users")
+        bump_version("groups")
+        for author_id in self.authors:
+            bump_version("author", author_id)
+        for user_id in self.followers:
+            bump_version("follow", user_id)
+        for group_id in self.groups.values():
+            bump_version("group", group_id)
+        for post_id in self.commented:
+            bump_version("post", post_id)
+
+
+def read_state(key):
+    state = ImportState.objects.filter(key=key).values(
+        "offset", "rows"
+    ).first()
+    return state or {"offset": 0, "rows": 0}
+
+
+def write_state(key, state):
+    # Вызывается в транзакции порции
+    ImportState.objects.update_or_create(key=key, defaults=state)
+
+
+def clear_state(key):
+    ImportState.objects.filter(key=key).delete()
@@ -0,0 +1,186 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.template.defaultfilters import filesizeformat
+from django.utils.translation import gettext_lazy as _
+from PIL import Image, ImageOps
+
+from .storage import content_hash, content_name
+
+EXTENSIONS = {
+    "JPEG": (".jpg", "image/jpeg"),
+    "WEBP": (".webp", "image/webp"),
+    "PNG": (".png", "image/png"),
+}
+
+# Поля Post, которые заполняет image_metadata
+METADATA_FIELDS = (
+    "image_width", "image_height", "image_size", "image_placeholder"
+)
+ORIENTATION = 0x0112
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor():
+    # spawn вместо fork: воркерам не нужно ничего из состояния процесса
+    # веб-сервера, а копировать его вместе с потоками небезопасно
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                settings.POST_IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def reencode(source, max_side, image_format, quality):
+    # Выполняется в процессе пула. source - путь к файлу или байты
+    if isinstance(source, bytes):
+        source = BytesIO(source)
+    with Image.open(source) as image:
+        # JPEG можно декодировать сразу в уменьшенном масштабе
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = (
+            image.mode in ("RGBA", "LA") or "transparency" in image.info
+        )
+        if has_alpha:
+            image = image.convert("RGBA")
+            if image_format == "JPEG":
+                background = Image.new("RGB", image.size, "white")
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+
+        output = BytesIO()
+        options = {"quality": quality, "optimize": True}
+        if image_format == "JPEG":
+            options["progressive"] = True
+        # exif и прочие метаданные не передаются - они отбрасываются
+        image.save(output, image_format, **options)
+        return output.getvalue()
+
+
+def run(*args):
+    if settings.POST_IMAGE_WORKER_KIND == "sync":
+        return reencode(*args)
+    return get_executor().submit(reencode, *args).result()
+
+
+def check_limits(uploaded):
+    if uploaded.size > settings.POST_IMAGE_MAX_BYTES:
+        raise ValidationError(
+            _("Файл слишком большой, максимальный размер - %(size)s"),
+            params={"size": filesizeformat(settings.POST_IMAGE_MAX_BYTES)},
+            code="file_too_large"
+        )
+    # Image.open читает только заголовок, пиксели не декодируются
+    uploaded.seek(0)
+    with Image.open(uploaded) as image:
+        width, height = image.size
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise ValidationError(
+            _("Изображение слишком большое: %(width)s×%(height)s пикселей"),
+            params={"width": width, "height": height},
+            code="too_many_pixels"
+        )
+
+
+def describe(source):
+    # Размеры, объём и цвет-заглушка (средний цвет) изображения.
+    # Для JPEG draft декодирует сразу уменьшенную копию
+    source.seek(0)
+    with Image.open(source) as image:
+        width, height = image.size
+        if image.getexif().get(ORIENTATION) in (5, 6, 7, 8):
+            width, height = height, width
+        image.draft("RGB", (64, 64))
+        image = image.convert("RGB")
+        image.thumbnail((64, 64))
+        color = image.resize((1, 1), Image.BOX).getpixel((0, 0))
+    source.seek(0)
+    return {
+        "image_width": width,
+        "image_height": height,
+        "image_size": source.size,
+        "image_placeholder": "#{:02x}{:02x}{:02x}".format(*color),
+    }
+
+
+def image_metadata(image):
+    # image - FieldFile: ещё не сохранённая загрузка или файл в хранилище
+    if not image:
+        return {
+            "image_width": None,
+            "image_height": None,
+            "image_size": None,
+            "image_placeholder": "",
+        }
+    if not image._committed:
+        return describe(image.file)
+    with image.storage.open(image.name) as source:
+        return describe(source)
+
+
+def ingest(uploaded, storage, upload_to):
+    """
+    Проверяет загруженное изображение и перекодирует его в пуле
+    процессов: без метаданных, не больше POST_IMAGE_MAX_SIDE по стороне.
+    Повторная загрузка того же файла возвращает содержимое уже
+    сохранённого без перекодирования.
+    """
+    check_limits(uploaded)
+    cache_key = f"ingest:{content_hash(uploaded)}"
+    name = cache.get(cache_key)
+    if name:
+        # Отдаём содержимое, а не только имя: если файл удалят до
+        # сохранения поста, posts.signals запишет его заново
+        try:
+            with storage.open(name) as stored:
+                data = stored.read()
+        except OSError:
+            pass
+        else:
+            content_types = dict(EXTENSIONS.values())
+            return SimpleUploadedFile(
+                os.path.basename(name), data,
+                content_types.get(os.path.splitext(name)[1])
+            )
+
+    if hasattr(uploaded, "temporary_file_path"):
+        source = uploaded.temporary_file_path()
+    else:
+        uploaded.seek(0)
+        source = uploaded.read()
+    image_format = settings.POST_IMAGE_FORMAT
+    try:
+        data = run(
+            source,
+            settings.POST_IMAGE_MAX_SIDE,
+            image_format,
+            settings.POST_IMAGE_QUALITY
+        )
+    except (OSError, ValueError):
+        raise ValidationError(
+            _("Не удалось обработать изображение"), code="invalid_image"
+        )
+    extension, content_type = EXTENSIONS[image_format]
+    name = os.path.splitext(os.path.basename(uploaded.name))[0] + extension
+    stored_name = content_name(
+        os.path.join(upload_to, name), content_hash(ContentFile(data))
+    )
+    cache.set(cache_key, stored_name, None)
+    return SimpleUploadedFile(name, data, content_type)
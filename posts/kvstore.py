@@ -0,0 +1,109 @@
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.kvstores import cached_db_kvstore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+
+class LRU:
+    def __init__(self, size):
+        self.size = size
+        self.data = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            try:
+                self.data.move_to_end(key)
+            except KeyError:
+                return None
+            return self.data[key]
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.size:
+                self.data.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.data.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+def cache_timeout(value):
+    # sorl кэширует и промахи на THUMBNAIL_CACHE_TIMEOUT (10 лет): тогда
+    # миниатюра, созданная другим процессом, никогда не станет видна.
+    # Промах живёт POST_THUMBNAIL_MISS_TIMEOUT секунд
+    if value == cached_db_kvstore.EMPTY_VALUE:
+        return settings.POST_THUMBNAIL_MISS_TIMEOUT
+    return sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+
+
+class KVStore(cached_db_kvstore.KVStore):
+    """
+    Хранилище метаданных sorl-thumbnail: LRU в памяти процесса перед
+    общим кэшем и базой. В LRU попадают только найденные значения -
+    миниатюру может создать другой процесс, и промах должен это увидеть.
+    """
+    lru = LRU(settings.POST_THUMBNAIL_LRU_SIZE)
+
+    def _get_raw(self, key):
+        value = self.lru.get(key)
+        if value is not None:
+            return value
+        value = self.cache.get(key)
+        if value is None:
+            value = KVStoreModel.objects.filter(key=key).values_list(
+                "value", flat=True
+            ).first() or cached_db_kvstore.EMPTY_VALUE
+            self.cache.set(key, value, cache_timeout(value))
+        if value == cached_db_kvstore.EMPTY_VALUE:
+            return None
+        self.lru.set(key, value)
+        return value
+
+    def _set_raw(self, key, value):
+        super()._set_raw(key, value)
+        self.lru.set(key, value)
+
+    def _delete_raw(self, *keys):
+        super()._delete_raw(*keys)
+        for key in keys:
+            self.lru.delete(key)
+
+    def clear(self, delete_thumbnails=False):
+        super().clear(delete_thumbnails)
+        self.lru.clear()
+
+    def prefetch(self, keys):
+        # Загружает значения для всех ключей страницы: один get_many
+        # из кэша и один запрос к базе для оставшихся
+        missing = [key for key in keys if self.lru.get(key) is None]
+        if not missing:
+            return
+        found = self.cache.get_many(missing)
+        missing = [key for key in missing if key not in found]
+        if missing:
+            rows = KVStoreModel.objects.filter(key__in=missing)
+            from_db = dict(rows.values_list("key", "value"))
+            if from_db:
+                self.cache.set_many(
+                    from_db, sorl_settings.THUMBNAIL_CACHE_TIMEOUT
+                )
+            empty = set(missing) - set(from_db)
+            if empty:
+                self.cache.set_many(
+                    dict.fromkeys(empty, cached_db_kvstore.EMPTY_VALUE),
+                    cache_timeout(cached_db_kvstore.EMPTY_VALUE)
+                )
+            found.update(from_db)
+        for key, value in found.items():
+            if value != cached_db_kvstore.EMPTY_VALUE:
+                self.lru.set(key, value)
@@ -0,0 +1,53 @@
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand
+
+from posts.ingest import METADATA_FIELDS, image_metadata
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет размеры, объём и цвет-заглушку изображений "
+        "у постов, сохранённых до их появления"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        queryset = (
+            Post.objects.exclude(image="").exclude(image=None)
+            .filter(image_width=None)
+            .only("pk", "image", *METADATA_FIELDS)
+            .order_by("pk")
+        )
+        done = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk)[:options["batch_size"]]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            # Одинаковые изображения хранятся одним файлом
+            by_name = {}
+            for post in batch:
+                by_name.setdefault(post.image.name, []).append(post)
+            updated = []
+            for name, posts in by_name.items():
+                try:
+                    metadata = image_metadata(posts[0].image)
+                except (SuspiciousFileOperation, OSError, ValueError) as error:
+                    failed += len(posts)
+                    self.stderr.write(f"{name}: {error}")
+                    continue
+                for post in posts:
+                    for field, value in metadata.items():
+                        setattr(post, field, value)
+                updated.extend(posts)
+            Post.objects.bulk_update(updated, METADATA_FIELDS)
+            done += len(updated)
+        self.stdout.write(self.style.SUCCESS(
+            f"Метаданные заполнены: {done}, с ошибками: {failed}"
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from posts import export
+
+
+class Command(BaseCommand):
+    help = "Выгружает посты или комментарии в NDJSON или CSV"
+
+    def add_arguments(self, parser):
+        parser.add_argument("kind", choices=sorted(export.KINDS))
+        parser.add_argument(
+            "--format", choices=sorted(export.FORMATS), default="ndjson"
+        )
+        parser.add_argument("--author", help="имя пользователя автора")
+        parser.add_argument("--group", help="slug группы")
+        parser.add_argument(
+            "--output", help="файл для выгрузки (по умолчанию stdout)"
+        )
+
+    def handle(self, *args, **options):
+        queryset = export.get_queryset(
+            options["kind"], author=options["author"], group=options["group"]
+        )
+        lines = export.export(options["kind"], queryset, options["format"])
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+        count = 0
+        with open(
+            options["output"], "w", encoding="utf-8", newline=""
+        ) as output:
+            for line in lines:
+                output.write(line)
+                count += 1
+        if options["format"] == "csv":
+            count -= 1
+        self.stderr.write(self.style.SUCCESS(f"Выгружено строк: {count}"))
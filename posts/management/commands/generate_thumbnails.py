@@ -0,0 +1,39 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = "Создаёт миниатюры для изображений существующих постов"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument(
+            "--threads", action="store_true",
+            help="использовать потоки вместо процессов"
+        )
+
+    def handle(self, *args, **options):
+        names = (
+            Post.objects.exclude(image="").exclude(image=None)
+            .order_by().values_list("image", flat=True).distinct().iterator()
+        )
+        if options["threads"]:
+            executor = ThreadPoolExecutor(options["workers"])
+        else:
+            executor = ProcessPoolExecutor(
+                options["workers"], initializer=thumbnails.close_connections
+            )
+        done = failed = 0
+        with executor:
+            for ok in executor.map(thumbnails.generate, names, chunksize=16):
+                if ok:
+                    done += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Миниатюры созданы: {done}, с ошибками: {failed}"
+        ))
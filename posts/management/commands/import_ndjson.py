@@ -0,0 +1,87 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.importer import (
+    TYPES, Importer, clear_state, read_state, write_state
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Загружает пользователей, группы, посты, комментарии и подписки "
+        "из NDJSON. Прерванную загрузку можно продолжить тем же вызовом"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--chunk-size", type=int, default=50000,
+            help="строк на одну транзакцию"
+        )
+        parser.add_argument(
+            "--type", choices=TYPES,
+            help="вид объектов для строк без поля type"
+        )
+        parser.add_argument(
+            "--state",
+            help="ключ позиции загрузки в базе (по умолчанию - полный путь "
+                 "к файлу)"
+        )
+        parser.add_argument(
+            "--restart", action="store_true",
+            help="начать с начала файла, не продолжая прерванную загрузку"
+        )
+        parser.add_argument(
+            "--skip-finalize", action="store_true",
+            help="не пересчитывать счётчики, поиск и ленты после загрузки"
+        )
+
+    def handle(self, *args, **options):
+        state_key = options["state"] or os.path.abspath(options["path"])
+        if options["restart"]:
+            clear_state(state_key)
+        state = read_state(state_key)
+        if state["offset"]:
+            self.stdout.write(f"Продолжаем со строки {state['rows']}")
+
+        importer = Importer(
+            batch_size=options["batch_size"],
+            chunk_size=options["chunk_size"],
+            default_type=options["type"]
+        )
+        start = time.perf_counter()
+        rows = 0
+        with open(options["path"], "rb") as source, importer.bulk_load():
+            for chunk, offset in importer.read_chunks(source, state["offset"]):
+                state = {"offset": offset, "rows": state["rows"] + len(chunk)}
+                with transaction.atomic():
+                    importer.load_chunk(chunk)
+                    write_state(state_key, state)
+                rows += len(chunk)
+                elapsed = time.perf_counter() - start
+                self.stdout.write(
+                    f"{state['rows']} строк, {rows / elapsed:.0f} строк/с"
+                )
+        elapsed = time.perf_counter() - start
+
+        loaded = ", ".join(
+            f"{kind}: {count}" for kind, count in importer.loaded.items()
+        )
+        self.stdout.write(
+            f"Загружено {rows} строк за {elapsed:.1f} с "
+            f"({rows / max(elapsed, 1e-9):.0f} строк/с). {loaded}, "
+            f"пропущено: {importer.skipped}"
+        )
+        if not options["skip_finalize"]:
+            start = time.perf_counter()
+            importer.finalize()
+            self.stdout.write(
+                f"Счётчики, поиск и ленты пересчитаны за "
+                f"{time.perf_counter() - start:.1f} с"
+            )
+        clear_state(state_key)
+        self.stdout.write(self.style.SUCCESS("Загрузка завершена"))
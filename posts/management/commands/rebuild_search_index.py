@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from posts import search
+from posts.models import Post, Comment
+
+
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовый индекс постов и комментариев"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError("Полнотекстовый поиск доступен только в SQLite")
+        for kind, model in (("post", Post), ("comment", Comment)):
+            count = search.rebuild(
+                kind, model.objects.all(), options["batch_size"]
+            )
+            self.stdout.write(f"{kind}: {count}")
+        self.stdout.write(self.style.SUCCESS("Индекс пересобран"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import counters, timeline
+
+
+class Command(BaseCommand):
+    help = "Пересчитывает денормализованные счётчики пользователей и постов"
+
+    def handle(self, *args, **options):
+        users, posts = counters.reconcile()
+        # Пересчитанное число подписчиков могло перейти
+        # TIMELINE_FANOUT_LIMIT; обратно авторов возвращает
+        # release_pulled_authors
+        timeline.mark_pulled()
+        self.stdout.write(self.style.SUCCESS(
+            f"Счётчики пересчитаны: пользователей {users}, постов {posts}"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+
+
+class Command(BaseCommand):
+    help = (
+        "Возвращает к раскладке по лентам авторов, у которых подписчиков "
+        "стало меньше TIMELINE_RELEASE_LIMIT. Запускается по расписанию, "
+        "вне запросов"
+    )
+
+    def handle(self, *args, **options):
+        count = timeline.release_authors()
+        self.stdout.write(
+            self.style.SUCCESS(f"Авторов возвращено к раскладке: {count}")
+        )
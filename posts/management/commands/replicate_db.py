@@ -0,0 +1,33 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from yatube.routers import replicate
+
+
+class Command(BaseCommand):
+    help = (
+        "Копирует основную базу SQLite в файлы реплик - замена "
+        "репликации для локального запуска"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--interval", type=float,
+            help="повторять каждые столько секунд"
+        )
+
+    def handle(self, *args, **options):
+        aliases = settings.REPLICA_DATABASES or ["replica"]
+        while True:
+            start = time.perf_counter()
+            for alias in aliases:
+                replicate(alias)
+            self.stdout.write(
+                f"{', '.join(aliases)}: "
+                f"{(time.perf_counter() - start) * 1000:.0f} мс"
+            )
+            if not options["interval"]:
+                break
+            time.sleep(options["interval"])
@@ -0,0 +1,89 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from posts.importer import Importer
+from posts.models import Post
+from posts.seeding import Generator, next_post_id
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу синтетическими пользователями, группами, постами, "
+        "комментариями и подписками со скошенными распределениями"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--groups", type=int, default=20)
+        parser.add_argument("--posts", type=int, default=20000)
+        parser.add_argument("--comments", type=int, default=40000)
+        parser.add_argument(
+            "--alpha", type=float, default=1.1,
+            help="показатель закона Ципфа для популярности авторов"
+        )
+        parser.add_argument(
+            "--images", type=int, default=0,
+            help="сколько разных изображений создать"
+        )
+        parser.add_argument(
+            "--image-share", type=float, default=0.2,
+            help="доля постов с изображением"
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--prefix", default="seed",
+            help="префикс имён пользователей и групп"
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--chunk-size", type=int, default=50000)
+
+    def handle(self, *args, **options):
+        generator = Generator(
+            users=options["users"],
+            groups=options["groups"],
+            posts=options["posts"],
+            comments=options["comments"],
+            alpha=options["alpha"],
+            images=options["images"],
+            image_share=options["image_share"],
+            seed=options["seed"],
+            first_post_id=next_post_id(),
+            prefix=options["prefix"],
+        )
+        field = Post._meta.get_field("image")
+        image_names = generator.create_images(field.storage, field.upload_to)
+
+        importer = Importer(
+            batch_size=options["batch_size"],
+            chunk_size=options["chunk_size"]
+        )
+        start = time.perf_counter()
+        chunk = []
+        with importer.bulk_load():
+            for row in generator.rows(image_names):
+                chunk.append(row)
+                if len(chunk) >= options["chunk_size"]:
+                    importer.load_chunk(chunk)
+                    chunk = []
+            if chunk:
+                importer.load_chunk(chunk)
+        loaded = ", ".join(
+            f"{kind}: {count}" for kind, count in importer.loaded.items()
+        )
+        self.stdout.write(
+            f"Создано за {time.perf_counter() - start:.1f} с: {loaded}"
+        )
+
+        start = time.perf_counter()
+        importer.finalize()
+        if image_names:
+            call_command("backfill_image_metadata", stdout=self.stdout)
+            call_command(
+                "generate_thumbnails", "--threads", stdout=self.stdout
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Счётчики, поиск, ленты и изображения готовы за "
+            f"{time.perf_counter() - start:.1f} с"
+        ))
@@ -0,0 +1,56 @@
+# Generated by Django 2.2.6 on 2026-10-18 02:21
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model("posts", "Post")
+    UserStats = apps.get_model("posts", "UserStats")
+
+    users = User.objects.annotate(
+        posts_total=Count("posts", distinct=True),
+        followers_total=Count("following", distinct=True),
+        following_total=Count("follower", distinct=True),
+    )
+    UserStats.objects.bulk_create(
+        (UserStats(
+            user_id=user.pk,
+            posts_count=user.posts_total,
+            followers_count=user.followers_total,
+            following_count=user.following_total,
+        ) for user in users.iterator()),
+        batch_size=500
+    )
+    posts = Post.objects.annotate(total=Count("comments")).filter(total__gt=0)
+    for post in posts.iterator():
+        Post.objects.filter(pk=post.pk).update(comments_count=post.total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0002_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('followers_count', models.PositiveIntegerField(default=0)),
+                ('following_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
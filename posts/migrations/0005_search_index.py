@@ -0,0 +1,36 @@
+from django.db import migrations
+
+TABLES = {
+    "posts_post_fts": "posts_post",
+    "posts_comment_fts": "posts_comment",
+}
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table, source in TABLES.items():
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {table} USING fts5(text)"
+        )
+        schema_editor.execute(
+            f"INSERT INTO {table} (rowid, text) SELECT id, text FROM {source}"
+        )
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for table in TABLES:
+        schema_editor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0004_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
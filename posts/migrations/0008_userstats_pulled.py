@@ -0,0 +1,27 @@
+# Generated by Django 2.2.6 on 2026-10-18 05:10
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    UserStats = apps.get_model("posts", "UserStats")
+    UserStats.objects.filter(
+        followers_count__gte=settings.TIMELINE_FANOUT_LIMIT
+    ).update(pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_image_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='pulled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
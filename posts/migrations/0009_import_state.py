@@ -0,0 +1,21 @@
+# Generated by Django 2.2.6 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_userstats_pulled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportState',
+            fields=[
+                ('key', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('offset', models.BigIntegerField(default=0)),
+                ('rows', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
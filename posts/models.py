@@ -1,6 +1,8 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 
+from .storage import ContentAddressedStorage
+
 User = get_user_model()
 
 
@@ -13,6 +15,21 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def feed(self, prefetch_comments=False):
+        # Всё, что нужно карточке поста, за фиксированное число запросов:
+        # число комментариев хранится в самом посте (comments_count)
+        queryset = self.select_related("author", "group")
+        if prefetch_comments:
+            queryset = queryset.prefetch_related(
+                models.Prefetch(
+                    "comments",
+                    queryset=Comment.objects.select_related("author")
+                )
+            )
+        return queryset
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField("date published", auto_now_add=True)
@@ -27,13 +44,39 @@ class Post(models.Model):
         on_delete=models.CASCADE,
         related_name="posts"
     )
-    image = models.ImageField(upload_to="posts/", blank=True, null=True)
+    image = models.ImageField(
+        upload_to="posts/",
+        storage=ContentAddressedStorage(),
+        db_index=True,
+        blank=True, null=True
+    )
+    # Заполняются при сохранении изображения (posts.signals), чтобы
+    # шаблоны не открывали файл ради размеров
+    image_width = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    image_height = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    image_size = models.PositiveIntegerField(
+        blank=True, null=True, editable=False
+    )
+    image_placeholder = models.CharField(
+        max_length=7, blank=True, editable=False
+    )
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text
 
     class Meta:
         ordering = ("-pub_date",)
+        indexes = [
+            models.Index(fields=["author", "-pub_date"]),
+            models.Index(fields=["group", "-pub_date"]),
+        ]
 
 
 class Comment(models.Model):
@@ -55,6 +98,9 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ("-created",)
+        indexes = [
+            models.Index(fields=["post", "-created"]),
+        ]
 
 
 class Follow(models.Model):
@@ -71,3 +117,61 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ('user', 'author')
+        indexes = [
+            models.Index(fields=["author", "user"]),
+        ]
+
+
+class UserStats(models.Model):
+    # Денормализованные счётчики пользователя, обновляются сигналами
+    # (posts.counters), расхождения исправляет команда reconcile_counters
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats"
+    )
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Посты автора не раскладываются по лентам, а подмешиваются при
+    # чтении (posts.timeline)
+    pulled = models.BooleanField(default=False)
+
+
+class TimelineEntry(models.Model):
+    # Материализованная лента подписок: одна строка на пару
+    # (подписчик, пост). Заполняется при публикации поста (fan-out on write)
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline"
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries"
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+"
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ("-pub_date",)
+        unique_together = ("user", "post")
+        indexes = [
+            models.Index(fields=["user", "-pub_date"]),
+            models.Index(fields=["user", "author"]),
+        ]
+
+
+class ImportState(models.Model):
+    # Позиция загрузки import_ndjson (posts.importer). Пишется в той же
+    # транзакции, что и порция строк, поэтому после сбоя не расходится
+    # с тем, что уже записано
+    key = models.CharField(max_length=255, primary_key=True)
+    offset = models.BigIntegerField(default=0)
+    rows = models.BigIntegerField(default=0)
@@ -0,0 +1,90 @@
+"""
+Кэш целых страниц для анонимных читателей.
+
+Middleware стоит первым в MIDDLEWARE: попадание в кэш не проходит ни
+сессии, ни CSRF, ни аутентификацию и не делает ни одного SQL-запроса.
+Сохраняются только ответы представлений с posts.conditional.
+conditional_page, вместе с версиями, от которых страница зависит; копия
+отдаётся, пока ни одна из этих версий не изменилась.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+
+# Заголовки, которые RFC 7232 велит повторить в ответе 304
+NOT_MODIFIED_HEADERS = ("ETag", "Last-Modified", "Cache-Control", "Vary")
+
+
+def page_cache_key(request):
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f"page:{path}"
+
+
+def is_anonymous(request):
+    # Без cookie сессии пользователь точно не вошёл; саму сессию
+    # не читаем, чтобы не обращаться к базе
+    # Пустую cookie оставляет SessionMiddleware, когда удаляет сессию
+    return not request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+
+
+def is_cacheable(request, response):
+    return (
+        request.method == "GET"
+        and getattr(request, "page_versions", None) is not None
+        and response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and "private" not in response.get("Cache-Control", "")
+        # Без даты страница отдана в секунду изменения: копия с датой
+        # сохранится при следующем запросе
+        and response.has_header("Last-Modified")
+    )
+
+
+class AnonymousPageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method not in ("GET", "HEAD") or not is_anonymous(request):
+            return self.get_response(request)
+        key = page_cache_key(request)
+        response = self.get_cached(request, key)
+        if response is None:
+            response = self.get_response(request)
+            if is_cacheable(request, response):
+                cache.set(key, (
+                    request.page_versions,
+                    response.status_code,
+                    list(response.items()),
+                    response.content,
+                ), settings.PAGE_CACHE_TIMEOUT)
+        return response
+
+    def get_cached(self, request, key):
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        versions, status, headers, content = entry
+        # Изменённая или вытесненная из кэша версия - копия устарела
+        if cache.get_many(list(versions)) != versions:
+            return None
+        headers = dict(headers)
+        not_modified = get_conditional_response(
+            request,
+            etag=headers.get("ETag"),
+            last_modified=parse_http_date_safe(headers.get("Last-Modified"))
+        )
+        if not_modified is not None:
+            for name in NOT_MODIFIED_HEADERS:
+                if name in headers:
+                    not_modified[name] = headers[name]
+            return not_modified
+        response = HttpResponse(content, status=status)
+        for name, value in headers.items():
+            response[name] = value
+        return response
@@ -0,0 +1,198 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from collections.abc import Sequence
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+def count_cache_key(name, *args):
+    return ":".join(["posts_count", name, *map(str, args)])
+
+
+def cached_count(key, queryset):
+    # Paginator считает COUNT(*) на каждый запрос; здесь итог берётся
+    # из кэша и может немного отставать от реального
+    return cache.get_or_set(
+        key, queryset.count, settings.PAGINATOR_COUNT_TIMEOUT
+    )
+
+
+def adjust_cached_count(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass
+
+
+def elided_page_range(page, on_each_side=2, on_ends=1, last_page=None):
+    # Номера страниц вокруг текущей и по краям, пропуски - None.
+    # Страницы после last_page не нумеруются: на их месте пропуск
+    num_pages = page.paginator.num_pages
+    number = page.number
+    if last_page is not None and num_pages > max(last_page, number):
+        num_pages = max(last_page, number)
+        return _elided(num_pages, number, on_each_side, on_ends) + [None]
+    return _elided(num_pages, number, on_each_side, on_ends)
+
+
+def _elided(num_pages, number, on_each_side, on_ends):
+    if num_pages <= (on_each_side + on_ends) * 2 + 1:
+        return list(range(1, num_pages + 1))
+
+    pages = []
+    if number > on_each_side + on_ends + 1:
+        pages.extend(range(1, on_ends + 1))
+        pages.append(None)
+        start = number - on_each_side
+    else:
+        start = 1
+    if number < num_pages - on_each_side - on_ends:
+        pages.extend(range(start, number + on_each_side + 1))
+        pages.append(None)
+        pages.extend(range(num_pages - on_ends + 1, num_pages + 1))
+    else:
+        pages.extend(range(start, num_pages + 1))
+    return pages
+
+
+def encode_cursor(obj, field="pub_date"):
+    value = f"{getattr(obj, field).isoformat()}|{obj.pk}"
+    return urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(token):
+    # Некорректный курсор считаем отсутствующим, как Paginator.get_page
+    # поступает с некорректным номером страницы
+    try:
+        value, pk = urlsafe_b64decode(token.encode()).decode().split("|")
+        value = parse_datetime(value)
+        pk = int(pk)
+    except (DecodeError, UnicodeError, ValueError):
+        return None
+    if value is None:
+        return None
+    return value, pk
+
+
+class KeysetPage(Sequence):
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return f"<KeysetPage of {len(self)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self.has_previous() or self.has_next()
+
+    @property
+    def next_cursor(self):
+        if self.has_next() and self.object_list:
+            return encode_cursor(self.object_list[-1], self.paginator.field)
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self.has_previous() and self.object_list:
+            return encode_cursor(self.object_list[0], self.paginator.field)
+        return None
+
+
+class KeysetPaginator:
+    """
+    Постраничный вывод по курсору (field, id) вместо LIMIT/OFFSET:
+    любая страница - один запрос по индексу без COUNT(*).
+    """
+    is_keyset = True
+
+    def __init__(self, object_list, per_page, field="pub_date"):
+        self.object_list = object_list
+        self.per_page = per_page
+        self.field = field
+
+    def older(self, value, pk):
+        field = self.field
+        return self.object_list.filter(
+            Q(**{f"{field}__lt": value}) | Q(**{field: value, "pk__lt": pk})
+        )
+
+    def newer(self, value, pk):
+        field = self.field
+        return self.object_list.filter(
+            Q(**{f"{field}__gt": value}) | Q(**{field: value, "pk__gt": pk})
+        )
+
+    def has_neighbour(self, items, index, neighbours):
+        # Соседняя страница есть, только если за крайней строкой этой
+        # страницы действительно что-то лежит; у пустой страницы соседей нет
+        if not items:
+            return False
+        item = items[index]
+        return neighbours(getattr(item, self.field), item.pk).exists()
+
+    def get_page(self, after=None, before=None):
+        after = decode_cursor(after) if after else None
+        before = decode_cursor(before) if before else None
+
+        field = self.field
+        if before is not None:
+            queryset = self.newer(*before).order_by(
+                field, "pk"
+            )[:self.per_page + 1]
+            items = list(queryset)
+            has_previous = len(items) > self.per_page
+            items = items[:self.per_page][::-1]
+            has_next = self.has_neighbour(items, -1, self.older)
+            return KeysetPage(items, self, has_next, has_previous)
+
+        queryset = self.object_list
+        if after is not None:
+            queryset = self.older(*after)
+        queryset = queryset.order_by(f"-{field}", "-pk")[:self.per_page + 1]
+        items = list(queryset)
+        has_next = len(items) > self.per_page
+        items = items[:self.per_page]
+        has_previous = (
+            after is not None and self.has_neighbour(items, 0, self.newer)
+        )
+        return KeysetPage(items, self, has_next, has_previous)
+
+
+def offset_paginator(object_list, per_page, field="pub_date"):
+    # Обычный Paginator, помеченный для шаблона: после offset_pages
+    # страниц ссылка "Следующая" ведёт на курсор KeysetPaginator. Порядок
+    # тот же, что у KeysetPaginator, чтобы курсор продолжал ленту с того
+    # же места
+    paginator = Paginator(object_list.order_by(f"-{field}", "-pk"), per_page)
+    paginator.cursor_field = field
+    paginator.offset_pages = settings.PAGINATOR_OFFSET_PAGES
+    return paginator
+
+
+def next_cursor(page):
+    # Курсор следующей страницы, если на этой нумерация заканчивается
+    paginator = page.paginator
+    field = getattr(paginator, "cursor_field", None)
+    if field is None or not page.has_next():
+        return None
+    if page.number < paginator.offset_pages:
+        return None
+    return encode_cursor(page[-1], field)
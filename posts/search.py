@@ -0,0 +1,81 @@
+import re
+
+from django.db import connection, transaction
+
+# Полнотекстовый индекс SQLite FTS5: по одной виртуальной таблице на
+# модель, rowid строки индекса совпадает с первичным ключом записи.
+# Таблицы создаёт миграция 0005_search_index
+INDEXES = {
+    "post": "posts_post_fts",
+    "comment": "posts_comment_fts",
+}
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_available():
+    return connection.vendor == "sqlite"
+
+
+def build_match(query):
+    # Пользовательский ввод не передаётся в синтаксис MATCH как есть:
+    # каждое слово становится префиксным запросом, слова объединяются по И
+    words = WORD_RE.findall(query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def index(kind, pk, text):
+    if not is_available():
+        return
+    table = INDEXES[kind]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE rowid = %s", [pk])
+        cursor.execute(
+            f"INSERT INTO {table} (rowid, text) VALUES (%s, %s)", [pk, text]
+        )
+
+
+def unindex(kind, pk):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {INDEXES[kind]} WHERE rowid = %s", [pk])
+
+
+def search(queryset, kind, query):
+    # Возвращает queryset, отсортированный по релевантности (bm25)
+    match = build_match(query)
+    if not match:
+        return queryset.none()
+    if not is_available():
+        return queryset.filter(text__icontains=query)
+    table = INDEXES[kind]
+    model_table = queryset.model._meta.db_table
+    return queryset.extra(
+        tables=[table],
+        where=[f"{table}.rowid = {model_table}.id", f"{table} MATCH %s"],
+        params=[match],
+        select={"rank": f"{table}.rank"},
+    ).order_by("rank", "-pk")
+
+
+@transaction.atomic
+def rebuild(kind, queryset, batch_size):
+    table = INDEXES[kind]
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+    count = 0
+    last_pk = 0
+    while True:
+        batch = list(
+            queryset.filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", "text")[:batch_size]
+        )
+        if not batch:
+            return count
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} (rowid, text) VALUES (%s, %s)", batch
+            )
+        count += len(batch)
+        last_pk = batch[-1][0]
@@ -0,0 +1,147 @@
+import random
+from bisect import bisect
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import BytesIO
+from itertools import accumulate
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageDraw, ImageFilter
+
+from .models import Post
+
+WORDS = (
+    "день утро вечер город дом кот собака море лес река книга кофе чай "
+    "работа отпуск поезд дорога друг семья музыка фильм погода снег "
+    "дождь солнце весна лето осень зима новый старый хороший большой "
+    "сегодня вчера завтра опять наконец очень просто давно"
+).split()
+
+
+class Generator:
+    """
+    Синтетические данные для posts.importer.Importer. Распределения
+    скошены, как в живых сообществах: популярность автора по закону
+    Ципфа с показателем alpha определяет и число его подписчиков, и
+    число постов; число подписок пользователя - распределение Парето;
+    комментарии чаще достаются свежим постам.
+    """
+
+    def __init__(self, users, groups, posts, comments, alpha=1.1,
+                 images=0, image_share=0.2, seed=1, first_post_id=1,
+                 prefix="seed"):
+        self.rng = random.Random(seed)
+        self.users = users
+        self.groups = groups
+        self.posts = posts
+        self.comments = comments
+        self.images = images
+        self.image_share = image_share
+        self.first_post_id = first_post_id
+        self.prefix = prefix
+        self.user_weights = list(accumulate(
+            1 / rank ** alpha for rank in range(1, users + 1)
+        ))
+        self.group_weights = list(accumulate(
+            1 / rank ** alpha for rank in range(1, groups + 1)
+        ))
+        self.start = datetime(2020, 1, 1, tzinfo=dt_timezone.utc)
+
+    def username(self, num):
+        return f"{self.prefix}_user_{num}"
+
+    def popular_user(self):
+        # Номер пользователя, выбранный с весом его популярности
+        point = self.rng.random() * self.user_weights[-1]
+        return bisect(self.user_weights, point)
+
+    def text(self, mean_words):
+        size = max(1, int(self.rng.lognormvariate(0, 0.8) * mean_words))
+        return " ".join(self.rng.choice(WORDS) for _ in range(size))
+
+    def date(self, num, total):
+        return (self.start + timedelta(days=365 * num / total)).isoformat()
+
+    def create_images(self, storage, upload_to):
+        # Небольшой набор изображений, общих для всех постов: хранилище
+        # раскладывает файлы по хэшу содержимого
+        names = []
+        for num in range(self.images):
+            image = Image.new("RGB", (1280, 853), tuple(
+                self.rng.randrange(256) for _ in range(3)
+            ))
+            draw = ImageDraw.Draw(image)
+            for _ in range(30):
+                box = sorted(self.rng.randrange(1280) for _ in range(2))
+                box += sorted(self.rng.randrange(853) for _ in range(2))
+                draw.ellipse(
+                    (box[0], box[2], box[1], box[3]),
+                    fill=tuple(self.rng.randrange(256) for _ in range(3))
+                )
+            buffer = BytesIO()
+            image.filter(ImageFilter.GaussianBlur(3)).save(
+                buffer, "JPEG", quality=85
+            )
+            names.append(storage.save(
+                f"{upload_to}{self.prefix}_{num}.jpg",
+                ContentFile(buffer.getvalue())
+            ))
+        return names
+
+    def rows(self, image_names=()):
+        for num in range(self.users):
+            yield {
+                "type": "user",
+                "username": self.username(num),
+                "date_joined": self.date(num, self.users),
+            }
+        for num in range(self.groups):
+            yield {
+                "type": "group",
+                "slug": f"{self.prefix}-group-{num}",
+                "title": f"Группа {num}",
+                "description": self.text(12),
+            }
+        for num in range(self.posts):
+            group = None
+            if self.groups and self.rng.random() < 0.7:
+                point = self.rng.random() * self.group_weights[-1]
+                num_group = bisect(self.group_weights, point)
+                group = f"{self.prefix}-group-{num_group}"
+            image = ""
+            if image_names and self.rng.random() < self.image_share:
+                image = self.rng.choice(image_names)
+            yield {
+                "type": "post",
+                "id": self.first_post_id + num,
+                "author": self.username(self.popular_user()),
+                "group": group,
+                "text": self.text(25),
+                "pub_date": self.date(num, self.posts),
+                "image": image,
+            }
+        for num in range(self.comments):
+            age = int(self.rng.expovariate(10 / self.posts))
+            post = max(0, self.posts - 1 - age)
+            yield {
+                "type": "comment",
+                "post": self.first_post_id + post,
+                "author": self.username(self.rng.randrange(self.users)),
+                "text": self.text(8),
+                "created": self.date(post, self.posts),
+            }
+        for num in range(self.users):
+            count = min(
+                int(self.rng.paretovariate(1.2) * 3), self.users - 1
+            )
+            authors = {self.popular_user() for _ in range(count)}
+            for author in authors - {num}:
+                yield {
+                    "type": "follow",
+                    "user": self.username(num),
+                    "author": self.username(author),
+                }
+
+
+def next_post_id():
+    last = Post.objects.order_by("-pk").values_list("pk", flat=True).first()
+    return (last or 0) + 1
@@ -0,0 +1,213 @@
+import logging
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver
+
+from sorl.thumbnail import default as thumbnail_default
+from sorl.thumbnail.images import ImageFile
+
+from . import counters, search, timeline
+from .ingest import image_metadata
+from .paginators import adjust_cached_count, count_cache_key
+from .models import Post, Group, Comment, Follow, UserStats
+from .versions import bump_version
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+
+def adjust_post_counts(post, delta):
+    counters.change_user_counters(post.author_id, posts_count=delta)
+    adjust_cached_count(count_cache_key("index"), delta)
+    if post.group_id is not None:
+        adjust_cached_count(count_cache_key("group", post.group_id), delta)
+
+
+def bump_post_versions(post_id, author_id, *group_ids):
+    # Версии страниц, на которых виден пост: лента, профиль автора,
+    # группы и страница самого поста (posts.conditional)
+    bump_version("global")
+    bump_version("post", post_id)
+    bump_version("author", author_id)
+    for group_id in set(group_ids) - {None}:
+        bump_version("group", group_id)
+
+
+def publish_post(post_id, author_id):
+    timeline.fan_out_post(post_id)
+    bump_version("author", author_id)
+
+
+def delete_image_file(storage, name):
+    # Проверка и удаление - под блокировкой записи (BEGIN IMMEDIATE в
+    # yatube.db): пост с этим файлом не закоммитится между ними, а пост,
+    # закоммиченный после, восстановит файл сам (restore_image_file)
+    with transaction.atomic():
+        if Post.objects.filter(image=name).exists():
+            return
+        try:
+            thumbnail_default.kvstore.delete(ImageFile(name, storage))
+            storage.delete(name)
+        except (SuspiciousFileOperation, OSError):
+            # Очистка файлов не должна ломать запрос, в котором удалён пост
+            logger.exception("Failed to delete image %s", name)
+
+
+def restore_image_file(storage, name, content):
+    # Одинаковые загрузки не пишут файл повторно (ContentAddressedStorage);
+    # если последний другой пост с ним удалили до нашего COMMIT, файл
+    # уже стёрт - записываем его снова
+    if not storage.exists(name):
+        storage.save(name, content)
+
+
+def release_image(name):
+    # Файлы изображений общие для одинаковых загрузок: удаляем файл
+    # и его миниатюры, только когда на него не ссылается ни один пост
+    if name:
+        storage = Post._meta.get_field("image").storage
+        transaction.on_commit(partial(delete_image_file, storage, name))
+
+
+def set_image_metadata(post):
+    try:
+        metadata = image_metadata(post.image)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        # Без метаданных карточка просто показывается без заглушки
+        logger.exception("Failed to read image %s", post.image.name)
+        metadata = image_metadata(None)
+    for field, value in metadata.items():
+        setattr(post, field, value)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous(sender, instance, **kwargs):
+    # Прежние изображение и группа: после сохранения освобождаем старый
+    # файл и обновляем версию группы, из которой пост ушёл
+    previous_image = None
+    if instance.pk is not None:
+        previous_image, instance._previous_group_id = Post.objects.filter(
+            pk=instance.pk
+        ).values_list("image", "group_id").first() or (None, None)
+        instance._previous_image = previous_image
+    image = instance.image
+    if not image._committed:
+        instance._image_content = image.file
+    if not image._committed or (image.name or None) != previous_image:
+        set_image_metadata(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    previous_image = getattr(instance, "_previous_image", None)
+    if previous_image and previous_image != instance.image.name:
+        release_image(previous_image)
+    content = instance.__dict__.pop("_image_content", None)
+    if content is not None:
+        transaction.on_commit(partial(
+            restore_image_file, instance.image.storage, instance.image.name,
+            content
+        ))
+    search.index("post", instance.pk, instance.text)
+    bump_post_versions(
+        instance.pk, instance.author_id, instance.group_id,
+        getattr(instance, "_previous_group_id", None)
+    )
+    if created:
+        transaction.on_commit(
+            partial(publish_post, instance.pk, instance.author_id)
+        )
+        adjust_post_counts(instance, 1)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    release_image(instance.image.name)
+    search.unindex("post", instance.pk)
+    # Удаление идёт внутри транзакции Collector: версия, сменённая до
+    # COMMIT, позволила бы закэшировать под ней страницу с ещё видимым
+    # постом
+    transaction.on_commit(partial(
+        bump_post_versions, instance.pk, instance.author_id,
+        instance.group_id
+    ))
+    adjust_post_counts(instance, -1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_saved(sender, instance, created, **kwargs):
+    search.index("comment", instance.pk, instance.text)
+    if created:
+        counters.change_comments_count(instance.post_id, 1)
+        bump_comment_versions(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    search.unindex("comment", instance.pk)
+    counters.change_comments_count(instance.post_id, -1)
+    transaction.on_commit(partial(bump_comment_versions, instance))
+
+
+def bump_comment_versions(comment):
+    # Число комментариев видно в карточке поста везде, где она выводится
+    post = Post.objects.filter(pk=comment.post_id).values_list(
+        "author_id", "group_id"
+    ).first()
+    if post is None:
+        bump_version("global")
+        bump_version("post", comment.post_id)
+    else:
+        bump_post_versions(comment.post_id, *post)
+
+
+@receiver(post_save, sender=User)
+def user_created(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+        bump_version("users")
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    bump_version("users")
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    bump_version("groups")
+
+
+def adjust_follow_counts(follow, delta):
+    counters.change_user_counters(follow.author_id, followers_count=delta)
+    counters.change_user_counters(follow.user_id, following_count=delta)
+
+
+def bump_follow_versions(follow):
+    # Профили обоих показывают число подписчиков и подписок
+    bump_version("author", follow.author_id)
+    bump_version("author", follow.user_id)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        adjust_follow_counts(instance, 1)
+        timeline.mark_pulled(instance.author_id)
+        timeline.backfill(instance.user_id, instance.author_id)
+        bump_version("follow", instance.user_id)
+        bump_follow_versions(instance)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    adjust_follow_counts(instance, -1)
+    timeline.cleanup(instance.user_id, instance.author_id)
+    transaction.on_commit(partial(bump_version, "follow", instance.user_id))
+    transaction.on_commit(partial(bump_follow_versions, instance))
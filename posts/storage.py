@@ -0,0 +1,62 @@
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    content.seek(0)
+    return digest.hexdigest()
+
+
+def content_name(name, digest):
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], digest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Файлы называются по sha256 содержимого: posts/ab/abcdef...jpg.
+    Одинаковые загрузки хранятся один раз, а миниатюры sorl, имена
+    которых зависят от имени исходника, создаются для них тоже один раз.
+    Файл удаляется, когда на него не ссылается ни один пост (posts.signals).
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым, а совпадение имён - это и есть дубликат
+        return name
+
+    def _save(self, name, content):
+        name = content_name(name, content_hash(content))
+        if self.exists(name):
+            return name
+
+        full_path = self.path(name)
+        os.makedirs(
+            os.path.dirname(full_path),
+            mode=self.directory_permissions_mode or 0o777,
+            exist_ok=True
+        )
+        # Пишем во временный файл и атомарно переименовываем: при гонке
+        # двух одинаковых загрузок побеждает любая, содержимое одно и то же
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(full_path))
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                for chunk in content.chunks():
+                    temp.write(chunk)
+            # mkstemp создаёт файл с правами 0600
+            os.chmod(temp_path, self.file_permissions_mode or 0o644)
+            os.replace(temp_path, full_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return name.replace("\\", "/")
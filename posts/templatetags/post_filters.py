@@ -0,0 +1,15 @@
+from django import template
+
+from posts.paginators import elided_page_range, next_cursor
+
+
+register = template.Library()
+
+
+@register.filter
+def page_window(page):
+    last_page = getattr(page.paginator, "offset_pages", None)
+    return elided_page_range(page, last_page=last_page)
+
+
+register.filter("next_cursor", next_cursor)
@@ -0,0 +1,19 @@
+from django import template
+
+from posts import thumbnails
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def responsive_image(image, kind):
+    if not image:
+        return None
+    return thumbnails.get_responsive(image, kind)
+
+
+@register.simple_tag
+def prefetch_thumbnails(posts, kind):
+    thumbnails.prefetch(posts, kind)
+    return ""
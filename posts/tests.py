@@ -1,14 +1,44 @@
+import csv
+import json
+import os
+import sqlite3
 import tempfile
+import threading
+import time
+from contextlib import closing
+from io import BytesIO, StringIO
+from unittest import mock
 
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase, Client, override_settings
+from django.test import (
+    TestCase, TransactionTestCase, Client, RequestFactory, override_settings
+)
+from django.core.management import call_command
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.http import HttpResponse
+from django.test.utils import CaptureQueriesContext
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.urls import reverse
+from django.utils.http import http_date
 from shutil import rmtree
 from PIL import Image
-
-from .models import Post, Group, Comment, Follow
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import (
+    Post, Group, Comment, Follow, ImportState, TimelineEntry, UserStats
+)
+from . import ingest, thumbnails, timeline
+from .importer import write_state
+from .kvstore import KVStore
+from .paginators import encode_cursor, next_cursor
+from .versions import bump_version, get_versions, version_key
+from yatube.db.base import DatabaseWrapper
+from yatube.metrics import registry
+from yatube.routers import (
+    PrimaryReplicaRouter, ReplicaMiddleware, replicate
+)
 
 User = get_user_model()
 
@@ -422,9 +452,8 @@ class PostTest(TestCase):
 
 
 class CacheTest(TestCase):
-    CACHE_TIME = 21
-
     def setUp(self):
+        cache.clear()
         self.client = Client()
 
         self.user = User.objects.create_user(
@@ -449,26 +478,1489 @@ class CacheTest(TestCase):
         )
         self.assertEqual(response.status_code, 200)
         post = self.user.posts.get(text=data["text"])
-        return post.text
+        return post
 
     def test_cache(self):
         c = self.client
 
-        self.add_post(c, num=0)
-        text = self.add_post(c, num=1)
+        post = self.add_post(c, num=0)
+        c.get(reverse("index"))
 
+        # изменение в обход сигналов не меняет версию - страница из кэша
+        Post.objects.filter(pk=post.pk).update(text="changed_text")
         self.assertNotContains(
-            c.post(reverse("index"), follow=True),
-            text,
+            c.get(reverse("index")),
+            "changed_text",
             status_code=200,
             html=False
         )
 
-        cache.clear()
-
+        text = self.add_post(c, num=1).text
         self.assertContains(
-            c.post(reverse("index"), follow=True),
+            c.get(reverse("index")),
             text,
             status_code=200,
             html=False
         )
+
+    def test_cache_varies_by_page(self):
+        c = self.client
+        Post.objects.bulk_create(
+            Post(text=f"post_{num}", author=self.user) for num in range(15)
+        )
+        bump_version("global")
+
+        first = c.get(reverse("index")).context["page"]
+        second = c.get(reverse("index"), {"page": 2})
+        self.assertNotContains(second, f'name="post_{first[0].pk}"')
+        self.assertContains(
+            second, f'name="post_{second.context["page"][0].pk}"'
+        )
+
+    def test_comment_invalidates_cache(self):
+        c = self.client
+        post = self.add_post(c, num=0)
+        c.get(reverse("index"))
+
+        c.post(
+            reverse("add_comment", kwargs={
+                "username": self.user.username,
+                "post_id": post.pk}),
+            data={"text": "comment"}
+        )
+        self.assertContains(c.get(reverse("index")), "1 комментариев")
+
+
+@override_settings(CACHES=DISABLE_CACHE)
+class TimelineTest(TransactionTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.subscriber = User.objects.create_user(username="subscriber")
+        self.author = User.objects.create_user(username="author")
+        self.client.force_login(self.subscriber)
+
+    def follow(self):
+        self.client.get(
+            reverse("profile_follow", kwargs={"username": "author"})
+        )
+
+    def feed(self):
+        response = self.client.get(reverse("follow_index"))
+        return [post.text for post in response.context["page"]]
+
+    def test_fan_out_on_write(self):
+        self.follow()
+        Post.objects.create(text="new_post", author=self.author)
+
+        self.assertEqual(TimelineEntry.objects.count(), 1)
+        self.assertEqual(self.feed(), ["new_post"])
+
+    def test_backfill_and_cleanup(self):
+        Post.objects.create(text="old_post", author=self.author)
+        self.follow()
+        self.assertEqual(self.feed(), ["old_post"])
+
+        self.client.get(
+            reverse("profile_unfollow", kwargs={"username": "author"})
+        )
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        self.assertEqual(self.feed(), [])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_pulled_author(self):
+        self.follow()
+        Post.objects.create(text="celebrity_post", author=self.author)
+
+        self.assertEqual(TimelineEntry.objects.count(), 0)
+        self.assertEqual(self.feed(), ["celebrity_post"])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2, TIMELINE_RELEASE_LIMIT=2)
+    def test_author_leaves_pull_mode(self):
+        Post.objects.create(text="old", author=self.author)
+        self.follow()
+        other = User.objects.create_user(username="other")
+        Follow.objects.create(user=other, author=self.author)
+        Post.objects.create(text="while_pulled", author=self.author)
+        self.assertEqual(self.feed(), ["while_pulled", "old"])
+
+        # Отписка не копирует посты: они по-прежнему подмешиваются
+        Follow.objects.filter(user=other).delete()
+        self.assertTrue(timeline.is_pulled_author(self.author.pk))
+        self.assertFalse(
+            TimelineEntry.objects.filter(post__text="while_pulled").exists()
+        )
+        self.assertEqual(self.feed(), ["while_pulled", "old"])
+
+        call_command(
+            "release_pulled_authors", stdout=tempfile.TemporaryFile("w")
+        )
+        self.assertFalse(timeline.is_pulled_author(self.author.pk))
+        self.assertTrue(
+            TimelineEntry.objects.filter(post__text="while_pulled").exists()
+        )
+        self.assertEqual(self.feed(), ["while_pulled", "old"])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=3, TIMELINE_RELEASE_LIMIT=2)
+    def test_release_hysteresis(self):
+        self.follow()
+        followers = [
+            User.objects.create_user(username=f"follower_{num}")
+            for num in range(2)
+        ]
+        for follower in followers:
+            Follow.objects.create(user=follower, author=self.author)
+        self.assertTrue(timeline.is_pulled_author(self.author.pk))
+
+        # Ниже TIMELINE_FANOUT_LIMIT, но не ниже TIMELINE_RELEASE_LIMIT
+        Follow.objects.filter(user=followers[0]).delete()
+        timeline.release_authors()
+        self.assertTrue(timeline.is_pulled_author(self.author.pk))
+
+        Follow.objects.filter(user=followers[1]).delete()
+        self.assertEqual(timeline.release_authors(), 1)
+        self.assertFalse(timeline.is_pulled_author(self.author.pk))
+
+    @override_settings(PAGINATOR_OFFSET_PAGES=1)
+    def test_cursor_seeks_timeline(self):
+        self.follow()
+        for num in range(12):
+            Post.objects.create(text=f"post_{num}", author=self.author)
+        first = self.client.get(reverse("follow_index"))
+        cursor = next_cursor(first.context["page"])
+        self.assertContains(first, f'href="?after={cursor}"')
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("follow_index"), {"after": cursor}
+            )
+        self.assertEqual(
+            [post.text for post in response.context["page"]],
+            ["post_1", "post_0"]
+        )
+        self.assertTrue(any(
+            '"posts_timelineentry"."pub_date" <' in query["sql"]
+            for query in queries.captured_queries
+        ))
+
+    def test_rebuild_command(self):
+        self.follow()
+        Post.objects.create(text="new_post", author=self.author)
+        TimelineEntry.objects.all().delete()
+
+        call_command("rebuild_timelines", stdout=tempfile.TemporaryFile("w"))
+        self.assertEqual(self.feed(), ["new_post"])
+
+
+@override_settings(CACHES=DISABLE_CACHE)
+class KeysetPaginatorTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        for num in range(25):
+            Post.objects.create(text=f"post_{num}", author=self.user)
+        self.url = reverse("profile", kwargs={"username": "test_user"})
+
+    def get_texts(self, response):
+        return [post.text for post in response.context["page"]]
+
+    def test_walk_forward_and_back(self):
+        first = self.client.get(self.url, {"after": ""})
+        self.assertEqual(first.context["page"].number, 1)
+
+        cursor = encode_cursor(Post.objects.get(text="post_15"))
+        second = self.client.get(self.url, {"after": cursor})
+        self.assertTrue(second.context["paginator"].is_keyset)
+        self.assertEqual(
+            self.get_texts(second),
+            [f"post_{num}" for num in range(14, 4, -1)]
+        )
+
+        third = self.client.get(
+            self.url, {"after": second.context["page"].next_cursor}
+        )
+        self.assertEqual(
+            self.get_texts(third),
+            [f"post_{num}" for num in range(4, -1, -1)]
+        )
+        self.assertFalse(third.context["page"].has_next())
+
+        back = self.client.get(
+            self.url, {"before": third.context["page"].previous_cursor}
+        )
+        self.assertEqual(self.get_texts(back), self.get_texts(second))
+
+    @override_settings(PAGINATOR_OFFSET_PAGES=2)
+    def test_pager_switches_to_cursor(self):
+        second = self.client.get(self.url, {"page": 2})
+        cursor = next_cursor(second.context["page"])
+        self.assertContains(second, f'href="?after={cursor}"')
+        self.assertNotContains(second, 'href="?page=3"')
+
+        third = self.client.get(self.url, {"after": cursor})
+        self.assertEqual(
+            self.get_texts(third),
+            [f"post_{num}" for num in range(4, -1, -1)]
+        )
+
+    def test_cursor_past_the_ends(self):
+        oldest = encode_cursor(Post.objects.get(text="post_0"))
+        newest = encode_cursor(Post.objects.get(text="post_24"))
+        for url in (self.url, reverse("index")):
+            for params in ({"after": oldest}, {"before": newest}):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 200)
+                page = response.context["page"]
+                self.assertEqual(len(page), 0)
+                self.assertFalse(page.has_other_pages())
+                self.assertIsNone(page.next_cursor)
+                self.assertIsNone(page.previous_cursor)
+
+    def test_neighbours_are_checked(self):
+        # Посты, на которые указывают курсоры, удалены: за краями
+        # страницы ничего нет
+        newest = Post.objects.get(text="post_24")
+        oldest = Post.objects.get(text="post_0")
+        cursors = encode_cursor(newest), encode_cursor(oldest)
+        newest.delete()
+        oldest.delete()
+
+        response = self.client.get(self.url, {"after": cursors[0]})
+        self.assertFalse(response.context["page"].has_previous())
+        self.assertNotContains(response, "?before=")
+
+        response = self.client.get(self.url, {"before": cursors[1]})
+        self.assertFalse(response.context["page"].has_next())
+        self.assertNotContains(response, "?after=")
+
+    def test_bad_cursor_returns_first_page(self):
+        response = self.client.get(self.url, {"after": "garbage"})
+        self.assertEqual(
+            self.get_texts(response),
+            [f"post_{num}" for num in range(24, 14, -1)]
+        )
+
+
+class CountFreePaginatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        Post.objects.bulk_create(
+            Post(text=f"post_{num}", author=self.user) for num in range(95)
+        )
+
+    def test_count_is_cached(self):
+        self.client.get(reverse("index"))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("index"), {"page": 5})
+        self.assertEqual(response.context["paginator"].count, 95)
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in queries.captured_queries)
+        )
+
+        Post.objects.create(text="new_post", author=self.user)
+        response = self.client.get(reverse("index"))
+        self.assertEqual(response.context["paginator"].count, 96)
+
+    @override_settings(PAGINATOR_OFFSET_PAGES=10)
+    def test_page_window(self):
+        response = self.client.get(reverse("index"), {"page": 5})
+        self.assertEqual(response.context["paginator"].num_pages, 10)
+        for number in (1, 3, 4, 6, 7, 10):
+            self.assertContains(response, f'href="?page={number}"')
+        for number in (2, 8, 9):
+            self.assertNotContains(response, f'href="?page={number}"')
+
+
+class DeleteVersionsTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="test_user")
+        self.post = Post.objects.create(text="text", author=self.user)
+        Comment.objects.create(post=self.post, author=self.user, text="c")
+
+    def assert_bumped_on_commit(self, delete, *parts):
+        keys = [version_key(*part) for part in parts]
+        before = get_versions(*keys)
+        with transaction.atomic():
+            delete()
+            self.assertEqual(get_versions(*keys), before)
+        for key, old, new in zip(keys, before, get_versions(*keys)):
+            self.assertNotEqual(new, old, key)
+
+    def test_post_delete(self):
+        self.assert_bumped_on_commit(
+            self.post.delete, ("global",), ("post", self.post.pk),
+            ("author", self.user.pk)
+        )
+
+    def test_comment_delete(self):
+        self.assert_bumped_on_commit(
+            Comment.objects.all().delete, ("post", self.post.pk)
+        )
+
+
+class FollowCacheTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.authors = (
+            User.objects.create_user(username="author_1"),
+            User.objects.create_user(username="author_2"),
+        )
+        self.clients = []
+        for num, author in enumerate(self.authors):
+            subscriber = User.objects.create_user(username=f"subscriber_{num}")
+            Follow.objects.create(user=subscriber, author=author)
+            client = Client()
+            client.force_login(subscriber)
+            self.clients.append(client)
+
+    def get_feed(self, client):
+        return client.get(reverse("follow_index")).content.decode()
+
+    def test_feed_is_cached_per_user(self):
+        Post.objects.create(text="first_author_post", author=self.authors[0])
+
+        self.assertIn("first_author_post", self.get_feed(self.clients[0]))
+        self.assertNotIn("first_author_post", self.get_feed(self.clients[1]))
+
+    def test_feed_is_invalidated_by_events(self):
+        client = self.clients[0]
+        self.get_feed(client)
+
+        post = Post.objects.create(text="new_text", author=self.authors[0])
+        self.assertIn("new_text", self.get_feed(client))
+
+        post.text = "edited_text"
+        post.save()
+        self.assertIn("edited_text", self.get_feed(client))
+
+        client.get(
+            reverse("profile_unfollow", kwargs={"username": "author_1"})
+        )
+        self.assertNotIn("edited_text", self.get_feed(client))
+
+
+class CountersTest(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author")
+        self.subscriber = User.objects.create_user(username="subscriber")
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_writes(self):
+        post = Post.objects.create(text="text", author=self.author)
+        Follow.objects.create(user=self.subscriber, author=self.author)
+        Comment.objects.create(post=post, author=self.subscriber, text="c")
+
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.subscriber).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+        Follow.objects.all().delete()
+        Comment.objects.all().delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.subscriber).following_count, 0)
+
+    def test_reconcile_command(self):
+        post = Post.objects.create(text="text", author=self.author)
+        Follow.objects.create(user=self.subscriber, author=self.author)
+        Comment.objects.create(post=post, author=self.subscriber, text="c")
+        UserStats.objects.update(
+            posts_count=7, followers_count=7, following_count=7
+        )
+        UserStats.objects.filter(user=self.subscriber).delete()
+        Post.objects.update(comments_count=0)
+
+        call_command("reconcile_counters", stdout=tempfile.TemporaryFile("w"))
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.author).following_count, 0)
+        self.assertEqual(self.stats(self.subscriber).following_count, 1)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+
+    def test_user_delete(self):
+        Post.objects.create(text="text", author=self.author)
+        Follow.objects.create(user=self.subscriber, author=self.author)
+        author_pk = self.author.pk
+        self.author.delete()
+        self.assertEqual(self.stats(self.subscriber).following_count, 0)
+        self.assertFalse(UserStats.objects.filter(user_id=author_pk).exists())
+
+
+@override_settings(CACHES=DISABLE_CACHE)
+class FeedQueriesTest(TransactionTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="reader")
+        self.author = User.objects.create_user(username="author")
+        self.group = Group.objects.create(title="group", slug="group")
+        Follow.objects.create(user=self.user, author=self.author)
+        self.client.force_login(self.user)
+
+    def add_posts(self, count):
+        for num in range(count):
+            post = Post.objects.create(
+                text=f"post_{num}", author=self.author, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.user, text="c")
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_constant_queries(self):
+        urls = (
+            reverse("index"),
+            reverse("group_posts", kwargs={"slug": "group"}),
+            reverse("profile", kwargs={"username": "author"}),
+            reverse("follow_index"),
+        )
+        self.add_posts(2)
+        small = [self.count_queries(url) for url in urls]
+        self.add_posts(8)
+        full = [self.count_queries(url) for url in urls]
+        self.assertEqual(small, full)
+
+
+@override_settings(CACHES=DISABLE_CACHE)
+class MetricsTest(TestCase):
+    def setUp(self):
+        registry.clear()
+        self.client = Client()
+        self.staff = User.objects.create_user(username="staff", is_staff=True)
+
+    def test_metrics_endpoint(self):
+        self.client.get(reverse("index"))
+
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(
+            response, 'yatube_request_duration_seconds_count{view="index"} 1'
+        )
+        self.assertContains(response, 'yatube_sql_queries_bucket{view="index"')
+        self.assertContains(
+            response, 'yatube_template_duration_seconds_sum{view="index"}'
+        )
+
+    def test_metrics_staff_only(self):
+        self.client.force_login(
+            User.objects.create_user(username="not_staff")
+        )
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(response.status_code, 302)
+
+    def test_render_keeps_precision(self):
+        registry.observe("index", {"sql_queries": 12345678})
+        registry.observe("index", {"request_duration_seconds": 0.1234567})
+        output = registry.render()
+        self.assertIn(
+            'yatube_sql_queries_sum{view="index"} 12345678\n', output
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_sum{view="index"} 0.1234567\n',
+            output
+        )
+        self.assertIn(
+            'yatube_sql_queries_bucket{view="index",le="500"} 0', output
+        )
+
+    @override_settings(METRICS_BUDGETS={"index": {"sql_queries": 0}})
+    def test_budget_warning(self):
+        with self.assertLogs("yatube.metrics", level="WARNING") as logs:
+            self.client.get(reverse("index"))
+        self.assertIn("sql_queries", logs.output[0])
+
+
+@override_settings(CACHES=DISABLE_CACHE)
+class SearchTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(
+            username="admin", is_staff=True, is_superuser=True
+        )
+        self.posts = (
+            Post.objects.create(text="Кошка спит на окне", author=self.user),
+            Post.objects.create(
+                text="Собака и кошка, кошка", author=self.user
+            ),
+            Post.objects.create(text="Про погоду", author=self.user),
+        )
+
+    def search(self, query):
+        response = self.client.get(reverse("search"), {"q": query})
+        self.assertEqual(response.status_code, 200)
+        return [post.pk for post in response.context["page"]]
+
+    def test_search_is_ranked(self):
+        self.assertEqual(
+            self.search("кошка"), [self.posts[1].pk, self.posts[0].pk]
+        )
+        self.assertEqual(self.search("пого"), [self.posts[2].pk])
+        self.assertEqual(self.search('"*'), [])
+
+    def test_index_follows_writes(self):
+        post = self.posts[2]
+        post.text = "Про кошку"
+        post.save()
+        self.assertIn(post.pk, self.search("кошку"))
+        self.assertEqual(self.search("погоду"), [])
+
+        post.delete()
+        self.assertNotIn(post.pk, self.search("кошку"))
+
+    def test_admin_uses_index(self):
+        Comment.objects.create(
+            post=self.posts[0], author=self.user, text="Отличный кот"
+        )
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("admin:posts_comment_changelist"), {"q": "кот"}
+        )
+        self.assertEqual(response.context["cl"].result_count, 1)
+        response = self.client.get(
+            reverse("admin:posts_post_changelist"), {"q": "собака"}
+        )
+        self.assertEqual(response.context["cl"].result_count, 1)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DELETE FROM posts_post_fts")
+        self.assertEqual(self.search("кошка"), [])
+
+        call_command(
+            "rebuild_search_index", batch_size=2,
+            stdout=tempfile.TemporaryFile("w")
+        )
+        self.assertEqual(len(self.search("кошка")), 2)
+
+
+@override_settings(
+    CACHES=DISABLE_CACHE,
+    MEDIA_ROOT=MEDIA_ROOT,
+    POST_THUMBNAIL_WORKER_KIND="sync"
+)
+class ThumbnailTest(TransactionTestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create_image(self):
+        buffer = BytesIO()
+        Image.new("RGB", (200, 200), "white").save(buffer, "PNG")
+        return SimpleUploadedFile("img.png", buffer.getvalue(), "image/png")
+
+    def card_image_src(self):
+        response = self.client.get(reverse("index"))
+        html = response.content.decode()
+        start = html.index('<img class="card-img" src="') + 27
+        return html[start:html.index('"', start)]
+
+    def test_thumbnail_generated_on_upload(self):
+        self.client.post(
+            reverse("new_post"),
+            {"text": "text", "image": self.create_image()}
+        )
+        post = Post.objects.get()
+        self.assertIsNotNone(thumbnails.get_ready(post.image, "card"))
+        self.assertNotEqual(self.card_image_src(), post.image.url)
+
+    def test_responsive_variants(self):
+        self.client.post(
+            reverse("new_post"),
+            {"text": "text", "image": self.create_image()}
+        )
+        post = Post.objects.get()
+        image = thumbnails.get_responsive(post.image, "card")
+        self.assertEqual(
+            image["src"].name, thumbnails.get_ready(post.image, "card").name
+        )
+        self.assertEqual(image["srcset"].count("w, "), 4)
+        self.assertEqual(len(image["sources"]), 1)
+        self.assertEqual(image["sources"][0]["type"], "image/webp")
+        self.assertIn(".webp 320w", image["sources"][0]["srcset"])
+
+        html = self.client.get(reverse("index")).content.decode()
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('loading="lazy"', html)
+
+    def test_fallback_and_command(self):
+        post = Post.objects.create(
+            text="text", author=self.user, image=self.create_image()
+        )
+        self.assertEqual(self.card_image_src(), post.image.url)
+
+        call_command(
+            "generate_thumbnails", "--threads",
+            stdout=tempfile.TemporaryFile("w")
+        )
+        self.assertNotEqual(self.card_image_src(), post.image.url)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    POST_THUMBNAIL_WORKER_KIND="sync"
+)
+class KVStoreTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        for num in range(3):
+            buffer = BytesIO()
+            Image.new("RGB", (50 + num, 50), "white").save(buffer, "PNG")
+            post = Post.objects.create(
+                text=f"post_{num}",
+                author=self.user,
+                image=SimpleUploadedFile(f"img_{num}.png", buffer.getvalue())
+            )
+            thumbnails.enqueue(post.image.name)
+
+    def tearDown(self):
+        rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def kvstore_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return [
+            query for query in queries.captured_queries
+            if "thumbnail_kvstore" in query["sql"]
+        ]
+
+    def test_page_is_prefetched(self):
+        KVStore.lru.clear()
+        cache.clear()
+        url = reverse("profile", kwargs={"username": "test_user"})
+        self.assertEqual(len(self.kvstore_queries(url)), 1)
+        self.assertEqual(self.kvstore_queries(url), [])
+        self.assertContains(
+            self.client.get(url), '<img class="card-img" src="/media/cache/',
+            count=3
+        )
+
+
+@override_settings(POST_THUMBNAIL_MISS_TIMEOUT=0)
+class KVStoreMissTest(TestCase):
+    # Миниатюру создал воркер в другом процессе: в его кэше и в базе
+    # она есть, а в кэше этого процесса остался промах
+    def setUp(self):
+        cache.clear()
+        KVStore.lru.clear()
+        self.kvstore = KVStore()
+        self.key = "sorl-thumbnail||image||other-process"
+
+    def test_get(self):
+        self.assertIsNone(self.kvstore._get_raw(self.key))
+        KVStoreModel.objects.create(key=self.key, value="{}")
+        self.assertEqual(self.kvstore._get_raw(self.key), "{}")
+
+    def test_prefetch(self):
+        self.kvstore.prefetch([self.key])
+        KVStoreModel.objects.create(key=self.key, value="{}")
+        self.assertEqual(self.kvstore._get_raw(self.key), "{}")
+
+
+@override_settings(CACHES=DISABLE_CACHE, MEDIA_ROOT=MEDIA_ROOT)
+class IngestTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, size, image_format="PNG", **options):
+        buffer = BytesIO()
+        Image.new("RGB", size, "red").save(buffer, image_format, **options)
+        return self.client.post(reverse("new_post"), {
+            "text": "text",
+            "image": SimpleUploadedFile("img.png", buffer.getvalue())
+        })
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_image_is_reencoded(self):
+        exif = Image.Exif()
+        exif[0x010F] = "Camera maker"
+        self.upload((300, 150), "JPEG", exif=exif.tobytes())
+
+        image = Post.objects.get().image
+        self.assertTrue(image.name.endswith(".jpg"))
+        with Image.open(image.path) as stored:
+            self.assertEqual(stored.size, (100, 50))
+            self.assertEqual(stored.format, "JPEG")
+            self.assertNotIn("exif", stored.info)
+
+    @override_settings(
+        POST_IMAGE_MAX_PIXELS=100,
+        POST_IMAGE_WORKER_KIND="sync"
+    )
+    def test_pixel_limit(self):
+        response = self.upload((20, 20))
+        self.assertFormError(
+            response, "form", "image",
+            "Изображение слишком большое: 20×20 пикселей"
+        )
+        self.assertEqual(Post.objects.count(), 0)
+
+    @override_settings(POST_IMAGE_MAX_BYTES=10, POST_IMAGE_WORKER_KIND="sync")
+    def test_byte_limit(self):
+        response = self.upload((20, 20))
+        self.assertEqual(
+            response.context["form"].errors["image"][0][:21],
+            "Файл слишком большой,"
+        )
+        self.assertEqual(Post.objects.count(), 0)
+
+
+@override_settings(
+    MEDIA_ROOT=MEDIA_ROOT,
+    POST_IMAGE_WORKER_KIND="sync",
+    POST_THUMBNAIL_WORKER_KIND="sync"
+)
+class DedupStorageTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, color="red", url=None):
+        buffer = BytesIO()
+        Image.new("RGB", (30, 30), color).save(buffer, "PNG")
+        self.client.post(url or reverse("new_post"), {
+            "text": "text",
+            "image": SimpleUploadedFile("img.png", buffer.getvalue())
+        })
+
+    def test_identical_uploads_share_file(self):
+        self.upload()
+        with mock.patch("posts.ingest.reencode") as reencode:
+            self.upload()
+        reencode.assert_not_called()
+
+        first, second = Post.objects.all()
+        self.assertEqual(first.image.name, second.image.name)
+        storage = first.image.storage
+        self.assertEqual(len(storage.listdir(os.path.dirname(
+            first.image.name))[1]), 1)
+
+        first.delete()
+        self.assertTrue(storage.exists(second.image.name))
+        second.delete()
+        self.assertFalse(storage.exists(second.image.name))
+
+    def test_upload_survives_concurrent_delete(self):
+        self.upload()
+        first = Post.objects.get()
+        real_ingest = ingest.ingest
+
+        def ingest_then_delete(*args):
+            # Другой запрос удаляет последний пост с этим файлом, пока
+            # дубликат ещё не сохранён
+            uploaded = real_ingest(*args)
+            first.delete()
+            self.assertFalse(first.image.storage.exists(first.image.name))
+            return uploaded
+
+        with mock.patch("posts.forms.ingest", ingest_then_delete):
+            self.upload()
+        post = Post.objects.get()
+        self.assertEqual(post.image.name, first.image.name)
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_replaced_image_is_released(self):
+        self.upload()
+        post = Post.objects.get()
+        old_name = post.image.name
+        self.upload("blue", reverse("post_edit", kwargs={
+            "username": "test_user", "post_id": post.pk
+        }))
+        post.refresh_from_db()
+        self.assertNotEqual(post.image.name, old_name)
+        self.assertFalse(post.image.storage.exists(old_name))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, POST_IMAGE_WORKER_KIND="sync")
+class ImageMetadataTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def create_image(self, size=(40, 20)):
+        buffer = BytesIO()
+        Image.new("RGB", size, (255, 0, 0)).save(buffer, "PNG")
+        return SimpleUploadedFile("img.png", buffer.getvalue())
+
+    def test_metadata_on_upload(self):
+        self.client.post(
+            reverse("new_post"), {"text": "text", "image": self.create_image()}
+        )
+        post = Post.objects.get()
+        self.assertEqual((post.image_width, post.image_height), (40, 20))
+        self.assertEqual(post.image_size, post.image.size)
+        self.assertEqual(post.image_placeholder[:3], "#fe")
+
+        with mock.patch.object(post.image.storage, "open") as storage_open:
+            response = self.client.get(reverse("index"))
+        storage_open.assert_not_called()
+        self.assertContains(response, "background-color: #fe")
+
+    def test_metadata_cleared_and_backfilled(self):
+        post = Post.objects.create(
+            text="text", author=self.user, image=self.create_image()
+        )
+        self.assertEqual(post.image_width, 40)
+        post.image = None
+        post.save()
+        self.assertIsNone(Post.objects.get().image_width)
+
+        post.image = self.create_image((10, 30))
+        post.save()
+        Post.objects.update(image_width=None, image_placeholder="")
+        call_command(
+            "backfill_image_metadata", stdout=tempfile.TemporaryFile("w")
+        )
+        post.refresh_from_db()
+        self.assertEqual((post.image_width, post.image_height), (10, 30))
+        self.assertTrue(post.image_placeholder)
+
+
+@override_settings(CACHES=DISABLE_CACHE, EXPORT_CHUNK_SIZE=2)
+class ExportTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.other = User.objects.create_user(username="other")
+        self.group = Group.objects.create(title="group", slug="group")
+        for num in range(5):
+            post = Post.objects.create(
+                text=f"пост {num}", author=self.user, group=self.group
+            )
+            Comment.objects.create(post=post, author=self.other, text="ok")
+        Post.objects.create(text="other post", author=self.other)
+
+    def read(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(hasattr(response, "content"))
+        return b"".join(response.streaming_content).decode()
+
+    def test_user_exports_own_posts(self):
+        self.client.force_login(self.user)
+        url = reverse("export_user", kwargs={
+            "username": "test_user", "kind": "posts"
+        })
+        lines = self.read(self.client.get(url)).splitlines()
+        self.assertEqual(len(lines), 5)
+        row = json.loads(lines[0])
+        self.assertEqual(row["text"], "пост 0")
+        self.assertEqual(row["group"], "group")
+
+        response = self.client.get(reverse("export_user", kwargs={
+            "username": "other", "kind": "posts"
+        }))
+        self.assertEqual(response.status_code, 403)
+
+    def test_staff_export_csv(self):
+        self.client.force_login(
+            User.objects.create_user(username="staff", is_staff=True)
+        )
+        response = self.client.get(
+            reverse("export", kwargs={"kind": "comments"}),
+            {"format": "csv", "group": "group"}
+        )
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.reader(self.read(response).splitlines()))
+        self.assertEqual(rows[0], ["id", "post", "author", "text", "created"])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(
+            response["Content-Disposition"],
+            'attachment; filename="comments-group.csv"'
+        )
+        for params in ({"group": "a\nb"}, {"author": "nobody"}):
+            response = self.client.get(
+                reverse("export", kwargs={"kind": "posts"}), params
+            )
+            self.assertEqual(response.status_code, 404)
+
+        self.client.force_login(self.user)
+        response = self.client.get(
+            reverse("export", kwargs={"kind": "posts"})
+        )
+        self.assertEqual(response.status_code, 302)
+
+    def test_command(self):
+        output = StringIO()
+        call_command(
+            "export_posts", "posts", "--group", "group", stdout=output
+        )
+        self.assertEqual(len(output.getvalue().splitlines()), 5)
+
+
+@override_settings(CACHES=DISABLE_CACHE)
+class ImportTest(TestCase):
+    def setUp(self):
+        rows = [
+            {"type": "user", "username": "author"},
+            {"type": "user", "username": "reader"},
+            {"type": "group", "slug": "group", "title": "Группа"},
+            {"type": "post", "id": 10, "author": "author", "group": "group",
+             "text": "импорт", "pub_date": "2020-01-02T03:04:05Z"},
+            {"type": "post", "author": "nobody", "text": "skipped",
+             "pub_date": "2020-01-02T03:04:05Z"},
+            {"type": "comment", "id": 7, "post": 10, "author": "reader",
+             "text": "ok", "created": "2020-01-03T00:00:00Z"},
+            {"type": "follow", "user": "reader", "author": "author"},
+        ]
+        handle, self.path = tempfile.mkstemp(suffix=".ndjson")
+        with os.fdopen(handle, "w") as output:
+            for row in rows:
+                output.write(json.dumps(row) + "\n")
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def run_import(self, *args):
+        call_command(
+            "import_ndjson", self.path, "--chunk-size", "3", *args,
+            stdout=StringIO()
+        )
+
+    def test_import(self):
+        self.run_import()
+        post = Post.objects.get()
+        self.assertEqual((post.pk, post.author.username), (10, "author"))
+        self.assertEqual(post.group.slug, "group")
+        self.assertEqual(
+            post.pub_date.isoformat(), "2020-01-02T03:04:05+00:00"
+        )
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(Comment.objects.get().post_id, 10)
+        self.assertTrue(Follow.objects.filter(
+            user__username="reader", author__username="author"
+        ).exists())
+        self.assertEqual(
+            UserStats.objects.get(user__username="author").followers_count, 1
+        )
+        self.assertFalse(ImportState.objects.exists())
+
+        self.run_import("--restart")
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(Comment.objects.count(), 1)
+
+    def test_indexes_restored(self):
+        def index_names():
+            with connection.cursor() as cursor:
+                return set(connection.introspection.get_constraints(
+                    cursor, Post._meta.db_table
+                ))
+
+        before = index_names()
+        self.run_import()
+        self.assertEqual(index_names(), before)
+
+    def test_resume(self):
+        with open(self.path, "rb") as source:
+            offset = sum(len(source.readline()) for _ in range(3))
+        ImportState.objects.create(key=self.path, offset=offset, rows=3)
+        User.objects.create_user(username="author")
+        User.objects.create_user(username="reader")
+        Group.objects.create(title="Группа", slug="group")
+
+        self.run_import()
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertEqual(User.objects.count(), 2)
+
+    def test_interrupted_chunk_is_not_repeated(self):
+        # Пост без id: повторная загрузка его порции создала бы дубликат
+        with open(self.path, "w") as output:
+            for row in (
+                {"type": "user", "username": "author"},
+                {"type": "post", "author": "author", "text": "без id",
+                 "pub_date": "2020-01-02T03:04:05Z"},
+                {"type": "follow", "user": "author", "author": "author"},
+            ):
+                output.write(json.dumps(row) + "\n")
+
+        def crash_after_post(key, state):
+            # Процесс падает, записав порцию с постом, но не позицию
+            if state["rows"] == 2:
+                raise OSError
+            write_state(key, state)
+
+        with mock.patch(
+            "posts.management.commands.import_ndjson.write_state",
+            crash_after_post
+        ), self.assertRaises(OSError):
+            call_command(
+                "import_ndjson", self.path, "--chunk-size", "1",
+                stdout=StringIO()
+            )
+        self.assertEqual(ImportState.objects.get().rows, 1)
+
+        call_command(
+            "import_ndjson", self.path, "--chunk-size", "1", stdout=StringIO()
+        )
+        self.assertEqual(Post.objects.filter(text="без id").count(), 1)
+
+
+@override_settings(CACHES=DISABLE_CACHE)
+class SeedDataTest(TestCase):
+    def test_seed_data(self):
+        call_command(
+            "seed_data", users=50, groups=3, posts=300, comments=200,
+            stdout=StringIO()
+        )
+        self.assertEqual(User.objects.count(), 50)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+
+        followers = sorted(
+            UserStats.objects.values_list("followers_count", flat=True)
+        )
+        self.assertGreater(followers[-1], followers[len(followers) // 2] * 3)
+        self.assertEqual(
+            sum(Post.objects.values_list("comments_count", flat=True)), 200
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+
+
+@override_settings(REPLICA_DATABASES=["replica"])
+class ReplicaRouterTest(TestCase):
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+        self.seen = []
+
+    def view(self, request):
+        self.seen.append(self.router.db_for_read(Post))
+        if request.method == "POST":
+            self.router.db_for_write(Post)
+            self.seen.append(self.router.db_for_read(Post))
+        return HttpResponse()
+
+    def request(self, method="get", **cookies):
+        request = getattr(RequestFactory(), method)("/")
+        request.COOKIES.update(cookies)
+        return ReplicaMiddleware(self.view)(request)
+
+    def test_routing(self):
+        response = self.request()
+        self.assertEqual(self.seen, ["replica"])
+        self.assertNotIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        # Вне запроса чтение идёт в основную базу
+        self.assertEqual(self.router.db_for_read(Post), "default")
+
+    def test_read_your_writes(self):
+        response = self.request("post")
+        self.assertEqual(self.seen, ["default", "default"])
+        pin = response.cookies[settings.REPLICA_PIN_COOKIE]
+        self.assertEqual(pin["max-age"], settings.REPLICA_PIN_SECONDS)
+
+        self.request(**{settings.REPLICA_PIN_COOKIE: pin.value})
+        self.assertEqual(self.seen[-1], "default")
+        self.request(**{settings.REPLICA_PIN_COOKIE: "1"})
+        self.assertEqual(self.seen[-1], "replica")
+
+
+class ReplicateTest(TransactionTestCase):
+    # backup не может читать базу, пока в ней открыта транзакция TestCase
+    def test_replicate(self):
+        Post.objects.create(
+            text="text", author=User.objects.create_user(username="user")
+        )
+        handle, path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        with mock.patch.dict(connections["replica"].settings_dict, NAME=path):
+            replicate("replica")
+        with closing(sqlite3.connect(path)) as replica:
+            self.assertEqual(
+                replica.execute("SELECT text FROM posts_post").fetchall(),
+                [("text",)]
+            )
+
+
+class SQLiteProfileTest(TestCase):
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA cache_size")
+            self.assertEqual(cursor.fetchone()[0], -64 * 1024)
+            cursor.execute("PRAGMA temp_store")
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+    def test_concurrent_writers(self):
+        # Чтение, затем запись в одной транзакции: без BEGIN IMMEDIATE и
+        # очереди параллельные потоки получают "database is locked"
+        directory = tempfile.mkdtemp()
+        self.addCleanup(rmtree, directory)
+        settings_dict = dict(
+            connection.settings_dict,
+            NAME=os.path.join(directory, "db.sqlite3"),
+            OPTIONS={"timeout": 1}
+        )
+        setup = DatabaseWrapper(settings_dict)
+        with setup.cursor() as cursor:
+            cursor.execute("CREATE TABLE counter (value integer)")
+            cursor.execute("INSERT INTO counter VALUES (0)")
+        setup.close()
+        errors = []
+
+        def work():
+            db = DatabaseWrapper(settings_dict)
+            try:
+                for _ in range(20):
+                    db.ensure_connection()
+                    db._start_transaction_under_autocommit()
+                    with db.cursor() as cursor:
+                        cursor.execute("SELECT value FROM counter")
+                        value = cursor.fetchone()[0]
+                        cursor.execute(
+                            "UPDATE counter SET value = %s", [value + 1]
+                        )
+                    db.commit()
+            except Exception as error:
+                errors.append(error)
+            finally:
+                db.close()
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        with closing(sqlite3.connect(settings_dict["NAME"])) as db:
+            self.assertEqual(
+                db.execute("SELECT value FROM counter").fetchone(), (160,)
+            )
+            self.assertEqual(
+                db.execute("PRAGMA journal_mode").fetchone(), ("wal",)
+            )
+
+
+@override_settings(CACHES=DISABLE_CACHE, COMMENTS_PER_PAGE=20)
+class CommentsPageTest(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.post = Post.objects.create(text="text", author=self.user)
+        self.url = reverse(
+            "post", kwargs={"username": "test_user", "post_id": self.post.pk}
+        )
+
+    def add_comments(self, count):
+        start = self.post.comments.count()
+        for num in range(start, start + count):
+            Comment.objects.create(
+                post=self.post, text=f"comment_{num}",
+                author=User.objects.create_user(username=f"reader_{num}")
+            )
+
+    def get_texts(self, page):
+        return [comment.text for comment in page]
+
+    def test_queries_do_not_grow_with_thread(self):
+        self.add_comments(3)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(self.url)
+        self.add_comments(42)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(self.url)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(len(response.context["comments_page"]), 20)
+        self.assertEqual(
+            sum("posts_comment" in query["sql"] for query in large), 1
+        )
+        self.assertNotIn("comments", response.context)
+        self.assertContains(response, "js-more-comments")
+
+    def test_load_older_comments(self):
+        self.add_comments(45)
+        response = self.client.get(self.url)
+        page = response.context["comments_page"]
+        self.assertEqual(
+            self.get_texts(page),
+            [f"comment_{num}" for num in range(44, 24, -1)]
+        )
+
+        fragment_url = reverse(
+            "post_comments",
+            kwargs={"username": "test_user", "post_id": self.post.pk}
+        )
+        texts = []
+        cursor = page.next_cursor
+        while cursor:
+            fragment = self.client.get(fragment_url, {"after": cursor})
+            self.assertNotContains(fragment, "<html")
+            page = fragment.context["comments_page"]
+            texts += self.get_texts(page)
+            cursor = page.next_cursor
+        self.assertEqual(
+            texts, [f"comment_{num}" for num in range(24, -1, -1)]
+        )
+        self.assertNotContains(fragment, "js-more-comments")
+
+
+def clock(module, now):
+    # Подменяет time.time только внутри module
+    return mock.patch(f"{module}.time", mock.Mock(time=lambda: now))
+
+
+def skip_write_second(test):
+    # Last-Modified не отдаётся в секунду изменения (posts.conditional):
+    # часы страниц сдвигаются вперёд, будто секунда записи уже прошла
+    patcher = clock("posts.conditional", time.time() + 60)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class ConditionalGetTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        skip_write_second(self)
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.other = User.objects.create_user(username="other_user")
+        self.group = Group.objects.create(title="group", slug="group")
+        self.post = Post.objects.create(
+            text="text", author=self.user, group=self.group
+        )
+        self.urls = {
+            "index": reverse("index"),
+            "group": reverse("group_posts", kwargs={"slug": "group"}),
+            "profile": reverse("profile", kwargs={"username": "test_user"}),
+            "post": reverse("post", kwargs={
+                "username": "test_user", "post_id": self.post.pk
+            }),
+        }
+
+    def revalidate(self, name):
+        first = self.client.get(self.urls[name])
+        self.assertEqual(first.status_code, 200)
+        return lambda: self.client.get(
+            self.urls[name], HTTP_IF_NONE_MATCH=first["ETag"]
+        ).status_code
+
+    @override_settings(VERSION_CACHE_TIMEOUT=20)
+    def test_versions_expire_without_shared_cache(self):
+        # Другой процесс мог изменить страницу, не тронув версии в кэше
+        # этого: по истечении VERSION_CACHE_TIMEOUT ETag выдаётся заново
+        revalidate = self.revalidate("index")
+        self.assertEqual(revalidate(), 304)
+        with clock("django.core.cache.backends.locmem", time.time() + 21):
+            self.assertEqual(revalidate(), 200)
+
+    def test_not_modified_before_queries(self):
+        response = self.client.get(self.urls["index"])
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("s-maxage", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                self.urls["index"], HTTP_IF_NONE_MATCH=response["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], response["ETag"])
+
+        since = self.client.get(
+            self.urls["index"],
+            HTTP_IF_MODIFIED_SINCE=response["Last-Modified"]
+        )
+        self.assertEqual(since.status_code, 304)
+
+    def test_no_last_modified_within_write_second(self):
+        second = int(time.time()) + 100
+        with clock("posts.versions", second):
+            bump_version("global")
+        with clock("posts.conditional", second + 0.5):
+            response = self.client.get(self.urls["index"])
+        self.assertFalse(response.has_header("Last-Modified"))
+        with clock("posts.conditional", second + 1):
+            response = self.client.get(self.urls["index"])
+        self.assertEqual(response["Last-Modified"], http_date(second))
+
+    def test_versions_follow_writes(self):
+        checks = {name: self.revalidate(name) for name in self.urls}
+        Post.objects.create(text="other", author=self.other)
+        self.assertEqual(checks["index"](), 200)
+        for name in ("group", "profile", "post"):
+            self.assertEqual(checks[name](), 304, name)
+
+        checks = {name: self.revalidate(name) for name in self.urls}
+        Comment.objects.create(post=self.post, author=self.other, text="c")
+        for name in self.urls:
+            self.assertEqual(checks[name](), 200, name)
+
+        checks = {name: self.revalidate(name) for name in self.urls}
+        Follow.objects.create(user=self.other, author=self.user)
+        self.assertEqual(checks["profile"](), 200)
+        self.assertEqual(checks["group"](), 304)
+
+        check = self.revalidate("group")
+        self.post.group = None
+        self.post.save()
+        self.assertEqual(check(), 200)
+
+    def test_authenticated_pages_are_private(self):
+        self.client.force_login(self.other)
+        response = self.client.get(self.urls["profile"])
+        self.assertIn("private", response["Cache-Control"])
+        self.assertFalse(response.has_header("Last-Modified"))
+
+        check = self.revalidate("profile")
+        self.assertEqual(check(), 304)
+        self.client.get(reverse(
+            "profile_follow", kwargs={"username": "test_user"}
+        ))
+        self.assertEqual(check(), 200)
+
+
+class PageCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        skip_write_second(self)
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        Post.objects.create(text="first", author=self.user)
+        self.url = reverse("profile", kwargs={"username": "test_user"})
+
+    def test_anonymous_hit_without_queries(self):
+        miss = self.client.get(self.url)
+        self.assertIsNotNone(miss.context)
+        with self.assertNumQueries(0):
+            hit = self.client.get(self.url)
+        self.assertIsNone(hit.context)
+        self.assertEqual(hit.content, miss.content)
+        self.assertEqual(hit["ETag"], miss["ETag"])
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(
+                self.url, HTTP_IF_NONE_MATCH=hit["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn("public", not_modified["Cache-Control"])
+
+        other = self.client.get(self.url, {"page": 2})
+        self.assertIsNotNone(other.context)
+
+    def test_invalidated_by_version(self):
+        self.client.get(self.url)
+        Post.objects.create(text="second", author=self.user)
+        response = self.client.get(self.url)
+        self.assertIsNotNone(response.context)
+        self.assertContains(response, "second")
+
+    def test_empty_session_cookie_is_anonymous(self):
+        self.client.get(self.url)
+        self.client.cookies["sessionid"] = ""
+        with self.assertNumQueries(0):
+            hit = self.client.get(self.url)
+        self.assertIsNone(hit.context)
+
+    def test_logged_in_bypass(self):
+        self.client.get(self.url)
+        self.client.force_login(self.user)
+        response = self.client.get(self.url)
+        self.assertIsNotNone(response.context)
+        self.assertEqual(response.context["user"], self.user)
+
+
+class SyndicationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = User.objects.create_user(username="test_user")
+        self.group = Group.objects.create(title="group", slug="group")
+
+    def add_posts(self, count):
+        for num in range(count):
+            Post.objects.create(
+                text=f"post_{num}", author=self.user, group=self.group
+            )
+
+    def test_feeds(self):
+        self.add_posts(3)
+        for name, kwargs in (
+            ("index", {}),
+            ("group", {"slug": "group"}),
+            ("profile", {"username": "test_user"}),
+        ):
+            rss = self.client.get(reverse(f"{name}_rss", kwargs=kwargs))
+            self.assertEqual(rss.status_code, 200)
+            self.assertIn("rss+xml", rss["Content-Type"])
+            self.assertEqual(rss.content.count(b"<item>"), 3)
+            atom = self.client.get(reverse(f"{name}_atom", kwargs=kwargs))
+            self.assertIn("atom+xml", atom["Content-Type"])
+            self.assertEqual(atom.content.count(b"<entry>"), 3)
+        missing = self.client.get(
+            reverse("group_rss", kwargs={"slug": "missing"})
+        )
+        self.assertEqual(missing.status_code, 404)
+
+    @override_settings(MEDIA_ROOT=MEDIA_ROOT)
+    def test_absolute_links(self):
+        buffer = BytesIO()
+        Image.new("RGB", (10, 10), "white").save(buffer, "PNG")
+        post = Post.objects.create(
+            text="with_image",
+            author=self.user,
+            image=SimpleUploadedFile("img.png", buffer.getvalue())
+        )
+        self.addCleanup(rmtree, MEDIA_ROOT, ignore_errors=True)
+        image_url = f"http://example.com{post.image.url}"
+
+        rss = self.client.get(reverse("index_rss")).content.decode()
+        self.assertIn(f'url="{image_url}"', rss)
+        atom = self.client.get(reverse("index_atom")).content.decode()
+        self.assertIn("<uri>http://example.com/test_user/</uri>", atom)
+        self.assertIn(f'href="{image_url}"', atom)
+
+    @override_settings(SYNDICATION_ITEMS=20)
+    def test_fixed_queries_and_conditional_get(self):
+        url = reverse("group_rss", kwargs={"slug": "group"})
+        self.add_posts(2)
+        # С cookie сессии запрос идёт мимо кэша страниц
+        bypass = Client(HTTP_COOKIE="sessionid=x")
+        # Первый запрос процесса ещё читает Site для абсолютных ссылок
+        bypass.get(url)
+        with CaptureQueriesContext(connection) as small:
+            bypass.get(url)
+        self.add_posts(30)
+        with CaptureQueriesContext(connection) as large:
+            response = bypass.get(url)
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(response.content.count(b"<item>"), 20)
+
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url)
+            not_modified = self.client.get(
+                url, HTTP_IF_NONE_MATCH=cached["ETag"]
+            )
+        self.assertEqual(not_modified.status_code, 304)
+
+        Post.objects.create(text="new", author=self.user, group=self.group)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=cached["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b"new", response.content)
@@ -0,0 +1,171 @@
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from sorl.thumbnail.kvstores.base import add_prefix
+
+from .ingest import EXTENSIONS
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def close_connections():
+    # Процессы пула получают копию соединений родителя после fork,
+    # потоки - собственные соединения; и те и другие закрываем сами
+    connections.close_all()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            size = settings.POST_THUMBNAIL_WORKERS
+            if settings.POST_THUMBNAIL_WORKER_KIND == "process":
+                _executor = ProcessPoolExecutor(
+                    size, initializer=close_connections
+                )
+            else:
+                _executor = ThreadPoolExecutor(
+                    size, thread_name_prefix="thumbnails"
+                )
+        return _executor
+
+
+def variants(kind):
+    # Варианты вида kind: (формат, ширина, геометрия, опции) для каждой
+    # ширины из POST_THUMBNAIL_WIDTHS, не больше ширины самого вида
+    geometry, options = settings.POST_THUMBNAILS[kind]
+    width, height = (int(side) for side in geometry.split("x"))
+    widths = sorted(
+        {size for size in settings.POST_THUMBNAIL_WIDTHS if size < width}
+        | {width}
+    )
+    return [
+        (
+            image_format,
+            size,
+            f"{size}x{round(height * size / width)}",
+            dict(options, format=image_format),
+        )
+        for image_format in settings.POST_THUMBNAIL_FORMATS
+        for size in widths
+    ]
+
+
+def generate(name):
+    # Создаёт все варианты всех видов из POST_THUMBNAILS для файла name
+    source = ImageFile(name, Post._meta.get_field("image").storage)
+    try:
+        for kind in settings.POST_THUMBNAILS:
+            for _, _, geometry, options in variants(kind):
+                get_thumbnail(source, geometry, **options)
+    except Exception:
+        logger.exception("Thumbnail generation failed for %s", name)
+        return False
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            close_connections()
+    return True
+
+
+def _done(name, future):
+    with _lock:
+        _pending.discard(name)
+
+
+def enqueue(name):
+    if not name:
+        return
+    if settings.POST_THUMBNAIL_WORKER_KIND == "sync":
+        generate(name)
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    future = get_executor().submit(generate, name)
+    future.add_done_callback(partial(_done, name))
+
+
+def schedule(post):
+    # Генерация начинается только после фиксации транзакции с постом
+    if post.image:
+        name = post.image.name
+        transaction.on_commit(lambda: enqueue(name))
+
+
+def thumbnail_file(file_, geometry, **options):
+    # То же имя миниатюры, что вычисляет ThumbnailBackend.get_thumbnail,
+    # но без открытия исходного файла
+    backend = default.backend
+    source = ImageFile(file_)
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault("format", backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return ImageFile(name, default.storage)
+
+
+def srcset(items):
+    return ", ".join(f"{thumbnail.url} {width}w" for width, thumbnail in items)
+
+
+def get_responsive(image, kind):
+    """
+    Готовые варианты изображения для <picture>: src и srcset запасного
+    формата и список <source> для остальных. None, если запасной формат
+    ещё не создан.
+    """
+    ready = {}
+    for image_format, width, geometry, options in variants(kind):
+        thumbnail = default.kvstore.get(
+            thumbnail_file(image, geometry, **options)
+        )
+        if thumbnail is not None:
+            ready.setdefault(image_format, []).append((width, thumbnail))
+    fallback = ready.pop(settings.POST_THUMBNAIL_FORMATS[-1], None)
+    if not fallback:
+        return None
+    return {
+        "src": fallback[-1][1],
+        "srcset": srcset(fallback),
+        "sources": [
+            {"type": EXTENSIONS[image_format][1], "srcset": srcset(items)}
+            for image_format, items in ready.items()
+        ],
+    }
+
+
+def get_ready(image, kind):
+    # Основная миниатюра (src из get_responsive) или None, если она ещё
+    # не готова
+    responsive = get_responsive(image, kind)
+    return responsive and responsive["src"]
+
+
+def prefetch(posts, kind):
+    if not hasattr(default.kvstore, "prefetch"):
+        return
+    files = [
+        thumbnail_file(post.image, geometry, **options)
+        for post in posts if post.image
+        for _, _, geometry, options in variants(kind)
+    ]
+    default.kvstore.prefetch([add_prefix(file_.key) for file_ in files])
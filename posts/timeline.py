@@ -0,0 +1,176 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Post, Follow, TimelineEntry, UserStats
+from .versions import get_versions, version_key
+
+
+def _bulk_insert(entries):
+    batch = []
+    for entry in entries:
+        batch.append(entry)
+        if len(batch) >= settings.TIMELINE_BATCH_SIZE:
+            TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def is_pulled_author(author_id):
+    # Посты авторов с большим числом подписчиков не раскладываются
+    # по лентам, а подмешиваются в ленту при чтении
+    return UserStats.objects.filter(user_id=author_id, pulled=True).exists()
+
+
+def pulled_authors(user):
+    return list(
+        Follow.objects
+        .filter(user=user, author__stats__pulled=True)
+        .values_list("author_id", flat=True)
+    )
+
+
+def mark_pulled(author_id=None):
+    # Автор дорос до TIMELINE_FANOUT_LIMIT: дальше его посты
+    # подмешиваются при чтении. Обратно автор возвращается только
+    # командой release_pulled_authors
+    stats = UserStats.objects.filter(
+        pulled=False,
+        followers_count__gte=settings.TIMELINE_FANOUT_LIMIT
+    )
+    if author_id is not None:
+        stats = stats.filter(user_id=author_id)
+    return stats.update(pulled=True)
+
+
+def fan_out_post(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is None or is_pulled_author(post.author_id):
+        return
+    subscribers = (
+        Follow.objects
+        .filter(author_id=post.author_id)
+        .values_list("user_id", flat=True)
+        .iterator()
+    )
+    _bulk_insert(
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post.pk,
+            author_id=post.author_id,
+            pub_date=post.pub_date
+        )
+        for user_id in subscribers
+    )
+
+
+def backfill(user_id, author_id, since=None):
+    # У очень активных авторов в ленту попадают только последние
+    # TIMELINE_BACKFILL_LIMIT постов. INSERT ... SELECT копирует строки
+    # внутри базы, не передавая их через Python. Посты авторов, которые
+    # подмешиваются при чтении, тоже копируются: автор может снова
+    # опуститься ниже TIMELINE_RELEASE_LIMIT
+    posts = Post.objects.filter(author_id=author_id)
+    if since is not None:
+        posts = posts.filter(pub_date__gte=since)
+    posts = posts.values_list(
+        "pk", "pub_date"
+    )[:settings.TIMELINE_BACKFILL_LIMIT]
+    select_sql, params = posts.query.sql_with_params()
+    ops = connection.ops
+    entries = TimelineEntry._meta
+    columns = ", ".join(
+        ops.quote_name(entries.get_field(name).column)
+        for name in ("user", "author", "post", "pub_date")
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"{ops.insert_statement(ignore_conflicts=True)} "
+            f"{ops.quote_name(entries.db_table)} ({columns}) "
+            f"SELECT %s, %s, posts.* FROM ({select_sql}) posts "
+            f"{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}",
+            (user_id, author_id) + params
+        )
+
+
+def release(author_id):
+    # Автор опустился ниже TIMELINE_RELEASE_LIMIT: посты, написанные,
+    # пока они подмешивались при чтении, копируются в ленты подписчиков.
+    # Каждый подписчик - отдельная короткая транзакция, а пока копирование
+    # не закончено, посты по-прежнему подмешиваются при чтении. Посты,
+    # опубликованные во время первого прохода, дописывает второй
+    started = timezone.now()
+    followers = list(
+        Follow.objects
+        .filter(author_id=author_id)
+        .values_list("user_id", flat=True)
+    )
+    for user_id in followers:
+        backfill(user_id, author_id)
+    UserStats.objects.filter(user_id=author_id).update(pulled=False)
+    for user_id in followers:
+        backfill(user_id, author_id, since=started)
+    return len(followers)
+
+
+def release_authors():
+    authors = (
+        UserStats.objects
+        .filter(
+            pulled=True,
+            followers_count__lt=settings.TIMELINE_RELEASE_LIMIT
+        )
+        .values_list("user_id", flat=True)
+    )
+    released = 0
+    for author_id in list(authors):
+        release(author_id)
+        released += 1
+    return released
+
+
+def cleanup(user_id, author_id):
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+@transaction.atomic
+def rebuild():
+    TimelineEntry.objects.all().delete()
+    UserStats.objects.filter(pulled=True).update(pulled=False)
+    mark_pulled()
+    follows = Follow.objects.values_list("user_id", "author_id").iterator()
+    count = 0
+    for user_id, author_id in follows:
+        backfill(user_id, author_id)
+        count += 1
+    return count
+
+
+def get_feed(user):
+    # feed_date - дата, по которой упорядочена лента: в обычном случае
+    # столбец TimelineEntry из того же JOIN, что и фильтр по user,
+    # поэтому и сортировка, и курсор идут по индексу (user, pub_date)
+    authors = pulled_authors(user)
+    if not authors:
+        return Post.objects.filter(
+            timeline_entries__user=user
+        ).annotate(
+            feed_date=F("timeline_entries__pub_date")
+        ).order_by("-feed_date")
+    return Post.objects.filter(
+        Q(pk__in=TimelineEntry.objects.filter(user=user).values("post_id"))
+        | Q(author_id__in=authors)
+    ).annotate(feed_date=F("pub_date")).order_by("-feed_date")
+
+
+def get_feed_version(user):
+    # Версия ленты меняется при подписке/отписке пользователя и при
+    # любом изменении у авторов, на которых он подписан
+    authors = Follow.objects.filter(user=user).values_list(
+        "author_id", flat=True
+    )
+    keys = [version_key("follow", user.pk)]
+    keys.extend(version_key("author", author_id) for author_id in authors)
+    return "-".join(map(str, get_versions(*keys)))
@@ -5,20 +5,38 @@ from . import views
 urlpatterns = [
     path("", views.index, name="index"),
     path("follow/", views.follow_index, name="follow_index"),
+    path("feeds/rss/", views.index_rss, name="index_rss"),
+    path("feeds/atom/", views.index_atom, name="index_atom"),
     path("group/<slug:slug>/", views.group_posts, name="group_posts"),
+    path("group/<slug:slug>/rss/", views.group_rss, name="group_rss"),
+    path("group/<slug:slug>/atom/", views.group_atom, name="group_atom"),
     path("new/", views.new_post, name="new_post"),
+    path("search/", views.search_posts, name="search"),
+    path("staff/export/<str:kind>/", views.export_all, name="export"),
     path("<str:username>/", views.profile, name="profile"),
+    path("<str:username>/rss/", views.profile_rss, name="profile_rss"),
+    path("<str:username>/atom/", views.profile_atom, name="profile_atom"),
     path("<str:username>/<int:post_id>/", views.post_view, name="post"),
     path(
         "<str:username>/<int:post_id>/edit/",
         views.post_edit,
         name="post_edit"
     ),
+    path(
+        "<str:username>/<int:post_id>/comments/",
+        views.post_comments,
+        name="post_comments"
+    ),
     path(
         "<str:username>/<int:post_id>/comment",
         views.add_comment,
         name="add_comment"
     ),
+    path(
+        "<str:username>/export/<str:kind>/",
+        views.export_user,
+        name="export_user"
+    ),
     path(
         "<str:username>/follow/",
         views.profile_follow,
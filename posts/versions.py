@@ -0,0 +1,57 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+# Счётчики версий для инвалидации кэша по событиям. Начальное значение
+# берётся из времени, чтобы после вытеснения ключа из кэша версия
+# не совпала ни с одной из выданных ранее
+def _initial():
+    return time.time_ns()
+
+
+def version_key(*parts):
+    return ":".join(["version", *map(str, parts)])
+
+
+def get_versions(*keys):
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _initial(), settings.VERSION_CACHE_TIMEOUT)
+            versions[key] = cache.get(key, _initial())
+    return [versions[key] for key in keys]
+
+
+def modified_key(*parts):
+    return ":".join(["modified", *map(str, parts)])
+
+
+def bump_version(*parts):
+    key = version_key(*parts)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _initial(), settings.VERSION_CACHE_TIMEOUT)
+    # Время изменения - для Last-Modified (posts.conditional)
+    cache.set(
+        modified_key(*parts), time.time(), settings.VERSION_CACHE_TIMEOUT
+    )
+
+
+def get_modified(*keys):
+    # Время последнего изменения по ключам modified_key; неизвестное
+    # время считаем текущим, чтобы не ответить 304 по устаревшей дате
+    modified = cache.get_many(keys)
+    for key in keys:
+        if key not in modified:
+            cache.add(key, time.time(), settings.VERSION_CACHE_TIMEOUT)
+            modified[key] = cache.get(key, time.time())
+    return max(modified.values())
+
+
+def get_generation():
+    # Глобальная версия контента: меняется при любом изменении постов
+    # и появлении комментариев
+    return get_versions(version_key("global"))[0]
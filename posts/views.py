@@ -1,9 +1,20 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
 from django.core.paginator import Paginator
+from django.http import Http404, StreamingHttpResponse
+from django.conf import settings
 
 from .models import Post, Group, Follow
+from .paginators import (
+    KeysetPaginator, cached_count, count_cache_key, offset_paginator
+)
+from . import conditional, export, feeds, search, thumbnails
+from .counters import get_stats
+from .timeline import get_feed, get_feed_version
+from .versions import get_generation
 from .forms import PostForm, CommentForm
 
 User = get_user_model()
@@ -14,34 +25,53 @@ def get_subscriptions(user, author):
         following = Follow.objects.filter(user=user, author=author).exists()
     else:
         following = False
+    stats = get_stats(author)
     return {
         "following": following,
-        "subscribers_count": Follow.objects.filter(author=author).count(),
-        "authors_count": Follow.objects.filter(user=author).count()
+        "subscribers_count": stats.followers_count,
+        "authors_count": stats.following_count
     }
 
 
-def create_paginator(request, post_list):
-    paginator = Paginator(post_list, 10)
+def create_paginator(request, post_list, count=None, field="pub_date"):
+    # Курсорная навигация включается параметрами ?after= / ?before=,
+    # ссылки на них даёт пагинатор после первых страниц
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    if after or before:
+        paginator = KeysetPaginator(post_list, 10, field=field)
+        page = paginator.get_page(after=after, before=before)
+        return (paginator, page)
+
+    paginator = offset_paginator(post_list, 10, field=field)
+    if count is not None:
+        paginator.count = count
     page_number = request.GET.get('page')
     page = paginator.get_page(page_number)
     return (paginator, page)
 
 
-# Кэширование настроено в самом шаблоне "index.html" {% cache 20 index_page %}
+# Кэширование настроено в самом шаблоне "index.html": ключ фрагмента
+# включает глобальную версию контента и адрес страницы
+@conditional.conditional_page(conditional.index_stamps)
 def index(request):
-    post_list = Post.objects.all()
-    paginator, page = create_paginator(request, post_list)
+    post_list = Post.objects.feed()
+    count = cached_count(count_cache_key("index"), post_list)
+    paginator, page = create_paginator(request, post_list, count)
     return render(request, "index.html", {
         "page": page,
-        "paginator": paginator
+        "paginator": paginator,
+        "generation": get_generation(),
+        "cache_timeout": settings.FEED_CACHE_TIMEOUT
     })
 
 
+@conditional.conditional_page(conditional.group_stamps)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    paginator, page = create_paginator(request, post_list)
+    post_list = group.posts.feed()
+    count = cached_count(count_cache_key("group", group.pk), post_list)
+    paginator, page = create_paginator(request, post_list, count)
     return render(request, "group.html", {
         "group": group,
         "page": page,
@@ -49,6 +79,40 @@ def group_posts(request, slug):
     })
 
 
+# RSS и Atom: версии и условный GET те же, что у страниц, поэтому
+# анонимный опрос ленты обслуживает posts.pagecache без запросов к базе
+index_rss = conditional.conditional_page(conditional.index_stamps)(
+    feeds.IndexFeed()
+)
+index_atom = conditional.conditional_page(conditional.index_stamps)(
+    feeds.AtomIndexFeed()
+)
+group_rss = conditional.conditional_page(conditional.group_stamps)(
+    feeds.GroupFeed()
+)
+group_atom = conditional.conditional_page(conditional.group_stamps)(
+    feeds.AtomGroupFeed()
+)
+profile_rss = conditional.conditional_page(conditional.profile_stamps)(
+    feeds.ProfileFeed()
+)
+profile_atom = conditional.conditional_page(conditional.profile_stamps)(
+    feeds.AtomProfileFeed()
+)
+
+
+def search_posts(request):
+    query = request.GET.get("q", "").strip()
+    post_list = search.search(Post.objects.feed(), "post", query)
+    paginator = Paginator(post_list, 10)
+    page = paginator.get_page(request.GET.get("page"))
+    return render(request, "search.html", {
+        "query": query,
+        "page": page,
+        "paginator": paginator
+    })
+
+
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -56,6 +120,7 @@ def new_post(request):
         post = form.save(commit=False)
         post.author = request.user
         post.save()
+        thumbnails.schedule(post)
         return redirect("index")
     return render(request, "new_post.html", {
         "form": form,
@@ -64,34 +129,70 @@ def new_post(request):
     })
 
 
+@conditional.conditional_page(conditional.profile_stamps)
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.posts.all()
-    paginator, page = create_paginator(request, post_list)
+    author = get_object_or_404(
+        User.objects.select_related("stats"),
+        username=username
+    )
+    post_list = author.posts.feed()
+    posts_count = get_stats(author).posts_count
+    paginator, page = create_paginator(request, post_list, posts_count)
     subscriptions = get_subscriptions(user=request.user, author=author)
     return render(request, "profile.html", {
         "author": author,
         "page": page,
         "paginator": paginator,
-        "author_posts_count": author.posts.count(),
+        "author_posts_count": posts_count,
         "subscriptions": subscriptions
     })
 
 
+@conditional.conditional_page(conditional.post_stamps)
 def post_view(request, username, post_id):
-    post = get_object_or_404(Post, pk=post_id, author__username=username)
+    post = get_object_or_404(
+        Post.objects.select_related("author__stats"),
+        pk=post_id,
+        author__username=username
+    )
     author = post.author
     form = CommentForm()
+    comments_page = get_comments_page(request, post)
     subscriptions = get_subscriptions(user=request.user, author=author)
     return render(request, "post.html", {
         "author": author,
         "post": post,
         "form": form,
-        "author_posts_count": author.posts.count(),
+        "comments_page": comments_page,
+        "author_posts_count": get_stats(author).posts_count,
         "subscriptions": subscriptions
     })
 
 
+def get_comments_page(request, post):
+    # Комментарии от новых к старым страницами по курсору: размер
+    # страницы и число запросов не зависят от длины обсуждения
+    comments = post.comments.select_related("author")
+    paginator = KeysetPaginator(
+        comments, settings.COMMENTS_PER_PAGE, field="created"
+    )
+    return paginator.get_page(after=request.GET.get("after"))
+
+
+def post_comments(request, username, post_id):
+    # Следующая страница комментариев для кнопки "Показать ещё"
+    post = get_object_or_404(
+        Post.objects.select_related("author"),
+        pk=post_id,
+        author__username=username
+    )
+    comments_page = get_comments_page(request, post)
+    return render(request, "include/comment_list.html", {
+        "post": post,
+        "comments_page": comments_page
+    })
+
+
 @login_required
 def post_edit(request, username, post_id):
     if request.user.username != username:
@@ -105,6 +206,8 @@ def post_edit(request, username, post_id):
     )
     if form.is_valid():
         form.save()
+        if "image" in form.changed_data:
+            thumbnails.schedule(post)
         return redirect("post", username=username, post_id=post_id)
 
     return render(request, "new_post.html", {
@@ -142,11 +245,14 @@ def add_comment(request, username, post_id):
 
 @login_required
 def follow_index(request):
-    posts = Post.objects.filter(author__following__user=request.user)
-    paginator, page = create_paginator(request, posts)
+    posts = get_feed(request.user).feed()
+    # Курсор идёт по дате записи в ленте: поиск по индексу (user, pub_date)
+    paginator, page = create_paginator(request, posts, field="feed_date")
     return render(request, "follow.html", {
         "page": page,
-        "paginator": paginator
+        "paginator": paginator,
+        "feed_version": get_feed_version(request.user),
+        "cache_timeout": settings.FEED_CACHE_TIMEOUT
     })
 
 
@@ -165,3 +271,45 @@ def profile_unfollow(request, username):
     if subscription.exists():
         subscription.delete()
     return redirect("profile", username=username)
+
+
+def export_response(request, kind, author=None, group=None):
+    # Ответ отдаётся по мере чтения строк из базы, см. posts.export
+    export_format = request.GET.get("format", "ndjson")
+    if kind not in export.KINDS or export_format not in export.FORMATS:
+        raise Http404
+    # group и author попадают в имя файла в Content-Disposition, поэтому
+    # принимаются только существующие slug и username
+    if group and not Group.objects.filter(slug=group).exists():
+        raise Http404
+    if author and not User.objects.filter(username=author).exists():
+        raise Http404
+    content_type, extension = export.FORMATS[export_format]
+    queryset = export.get_queryset(kind, author=author, group=group)
+    response = StreamingHttpResponse(
+        export.export(kind, queryset, export_format),
+        content_type=f"{content_type}; charset=utf-8"
+    )
+    filename = "-".join(part for part in (kind, author, group) if part)
+    response["Content-Disposition"] = (
+        f'attachment; filename="{filename}.{extension}"'
+    )
+    return response
+
+
+@staff_member_required
+def export_all(request, kind):
+    return export_response(
+        request, kind,
+        author=request.GET.get("author"),
+        group=request.GET.get("group")
+    )
+
+
+@login_required
+def export_user(request, username, kind):
+    if request.user.username != username and not request.user.is_staff:
+        raise PermissionDenied
+    return export_response(
+        request, kind, author=username, group=request.GET.get("group")
+    )
@@ -0,0 +1,118 @@
+"""
+SQLite для нескольких воркеров: PRAGMA из DATABASES[...]["PRAGMAS"] на
+каждом новом соединении и очередь на запись внутри процесса.
+
+SQLite допускает одного писателя. Без очереди потоки, одновременно
+начавшие запись, спорят за блокировку файла, и транзакция, которая уже
+читала, получает "database is locked" без ожидания. Здесь транзакции
+начинаются с BEGIN IMMEDIATE под общей для процесса блокировкой, а
+одиночные INSERT/UPDATE/DELETE вне транзакции берут ту же блокировку:
+вместо ошибок запись становится в короткую очередь.
+"""
+import threading
+
+from django.db.backends.sqlite3 import base
+
+Database = base.Database
+
+READ_STATEMENTS = ("SELECT", "PRAGMA", "EXPLAIN")
+
+_locks = {}
+_locks_lock = threading.Lock()
+
+
+def get_write_lock(name):
+    with _locks_lock:
+        return _locks.setdefault(name, threading.RLock())
+
+
+def acquire(lock, timeout):
+    if not lock.acquire(timeout=timeout):
+        raise Database.OperationalError("database is locked")
+
+
+class Connection(Database.Connection):
+    write_lock = None
+    timeout = None
+
+
+class CursorWrapper(base.SQLiteCursorWrapper):
+    def is_write(self, query):
+        return not query.lstrip()[:7].upper().startswith(READ_STATEMENTS)
+
+    def execute(self, query, params=None):
+        connection = self.connection
+        if connection.in_transaction or not self.is_write(query):
+            return super().execute(query, params)
+        acquire(connection.write_lock, connection.timeout)
+        try:
+            return super().execute(query, params)
+        finally:
+            connection.write_lock.release()
+
+    def executemany(self, query, param_list):
+        connection = self.connection
+        if connection.in_transaction:
+            return super().executemany(query, param_list)
+        acquire(connection.write_lock, connection.timeout)
+        try:
+            return super().executemany(query, param_list)
+        finally:
+            connection.write_lock.release()
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    held_write_lock = None
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        params["factory"] = Connection
+        return params
+
+    def get_new_connection(self, conn_params):
+        connection = super().get_new_connection(conn_params)
+        connection.write_lock = get_write_lock(self.settings_dict["NAME"])
+        # Тот же срок, что и у busy timeout самого sqlite3
+        connection.timeout = conn_params.get("timeout", 5)
+        pragmas = self.settings_dict.get("PRAGMAS", {})
+        for name, value in pragmas.items():
+            connection.execute(f"PRAGMA {name} = {value}")
+        return connection
+
+    def create_cursor(self, name=None):
+        return self.connection.cursor(factory=CursorWrapper)
+
+    def _start_transaction_under_autocommit(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку записи в файле: транзакция
+        # не может упереться в чужую запись посередине, после чтения
+        lock = self.connection.write_lock
+        acquire(lock, self.connection.timeout)
+        self.held_write_lock = lock
+        try:
+            self.cursor().execute("BEGIN IMMEDIATE")
+        except Exception:
+            self.release_write_lock()
+            raise
+
+    def release_write_lock(self):
+        lock, self.held_write_lock = self.held_write_lock, None
+        if lock is not None:
+            lock.release()
+
+    def _commit(self):
+        try:
+            return super()._commit()
+        finally:
+            self.release_write_lock()
+
+    def _rollback(self):
+        try:
+            return super()._rollback()
+        finally:
+            self.release_write_lock()
+
+    def _close(self):
+        try:
+            self.release_write_lock()
+        finally:
+            super()._close()
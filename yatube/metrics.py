@@ -0,0 +1,187 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.http import HttpResponse
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger("yatube.metrics")
+
+_state = threading.local()
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        for bound, count in zip(self.buckets, self.counts):
+            yield f"{bound}", count
+        yield "+Inf", self.count
+
+
+class Registry:
+    # Гистограммы по каждому представлению (url_name), хранятся в памяти
+    # процесса и обнуляются при его перезапуске
+    METRICS = (
+        ("request_duration_seconds", "Wall time of the request",
+         LATENCY_BUCKETS),
+        ("sql_duration_seconds", "Total SQL time per request",
+         LATENCY_BUCKETS),
+        ("template_duration_seconds", "Template render time per request",
+         LATENCY_BUCKETS),
+        ("sql_queries", "Number of SQL queries per request",
+         QUERY_BUCKETS),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.histograms = {
+            name: defaultdict(lambda buckets=buckets: Histogram(buckets))
+            for name, _, buckets in self.METRICS
+        }
+
+    def observe(self, view, values):
+        with self.lock:
+            for name, value in values.items():
+                self.histograms[name][view].observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, description, _ in self.METRICS:
+                metric = f"yatube_{name}"
+                lines.append(f"# HELP {metric} {description}")
+                lines.append(f"# TYPE {metric} histogram")
+                for view, histogram in sorted(self.histograms[name].items()):
+                    for bound, count in histogram.samples():
+                        lines.append(
+                            f'{metric}_bucket{{view="{view}",le="{bound}"}} '
+                            f"{count}"
+                        )
+                    lines.append(
+                        # Без :g - он округляет до 6 значащих цифр
+                        f'{metric}_sum{{view="{view}"}} {histogram.sum}'
+                    )
+                    lines.append(
+                        f'{metric}_count{{view="{view}"}} {histogram.count}'
+                    )
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        depth = getattr(_state, "template_depth", 0)
+        _state.template_depth = depth + 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            _state.template_depth = depth
+            # Вложенные render_to_string уже учтены во внешнем вызове
+            if depth == 0 and hasattr(_state, "template_time"):
+                _state.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        template = super().from_string(template_code)
+        return InstrumentedTemplate(template.template, self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.time = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.time += time.perf_counter() - start
+            self.count += 1
+
+
+def get_budget(view):
+    budgets = settings.METRICS_BUDGETS
+    return {**budgets.get("default", {}), **budgets.get(view, {})}
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        counter = QueryCounter()
+        _state.template_time = 0
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(counter))
+            response = self.get_response(request)
+        wall_time = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else "unresolved"
+        values = {
+            "request_duration_seconds": wall_time,
+            "sql_duration_seconds": counter.time,
+            "template_duration_seconds": _state.template_time,
+            "sql_queries": counter.count,
+        }
+        del _state.template_time
+        registry.observe(view, values)
+        self.check_budget(request, view, values)
+        return response
+
+    def check_budget(self, request, view, values):
+        budget = get_budget(view)
+        exceeded = [
+            f"{name}={values[name]:g} > {limit:g}"
+            for name, limit in budget.items()
+            if values[name] > limit
+        ]
+        if exceeded:
+            logger.warning(
+                "Request %s %s (%s) over budget: %s",
+                request.method, request.path, view, ", ".join(exceeded)
+            )
+
+
+@staff_member_required
+def metrics(request):
+    return HttpResponse(
+        registry.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
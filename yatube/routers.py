@@ -0,0 +1,94 @@
+import random
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+# Чтение с реплик включается только внутри запроса, разрешённого
+# ReplicaMiddleware: команды, потоки воркеров и сигналы вне запроса
+# всегда работают с основной базой
+_state = threading.local()
+
+PRIMARY = "default"
+
+
+class PrimaryReplicaRouter:
+    """
+    Запись - в основную базу, чтение - с одной из REPLICA_DATABASES.
+    После первой записи в запросе всё остальное чтение в нём тоже идёт
+    в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = settings.REPLICA_DATABASES
+        if replicas and getattr(_state, "use_replica", False):
+            return random.choice(replicas)
+        return PRIMARY
+
+    def db_for_write(self, model, **hints):
+        _state.use_replica = False
+        _state.wrote = True
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат копию тех же таблиц
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Реплики получают схему вместе с данными при репликации
+        return db == PRIMARY
+
+
+class ReplicaMiddleware:
+    """
+    Read-your-writes: после запроса с записью пользователь получает cookie
+    REPLICA_PIN_COOKIE, и REPLICA_PIN_SECONDS секунд все его запросы
+    читают из основной базы - реплика успевает догнать её. Cookie, а не
+    сессия: сессия сама читается из базы.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def is_pinned(self, request):
+        try:
+            until = float(request.COOKIES.get(settings.REPLICA_PIN_COOKIE, 0))
+        except ValueError:
+            return False
+        return until > time.time()
+
+    def __call__(self, request):
+        _state.use_replica = (
+            request.method in ("GET", "HEAD") and not self.is_pinned(request)
+        )
+        _state.wrote = False
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.use_replica = False
+        if _state.wrote:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                str(time.time() + settings.REPLICA_PIN_SECONDS),
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite="Lax"
+            )
+        return response
+
+
+def replicate(alias):
+    """
+    Замена настоящей репликации для локального запуска: копирует
+    основную базу SQLite в файл реплики через backup API - читатели
+    реплики видят либо старую, либо новую копию целиком
+    """
+    primary = connections[PRIMARY]
+    primary.ensure_connection()
+    target = sqlite3.connect(connections[alias].settings_dict["NAME"])
+    try:
+        primary.connection.backup(target)
+    finally:
+        target.close()
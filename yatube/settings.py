@@ -51,6 +51,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: попадания в кэш страниц не проходят остальные middleware
+    'posts.pagecache.AnonymousPageCacheMiddleware',
+    'yatube.metrics.RequestMetricsMiddleware',
+    'yatube.routers.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -65,7 +69,7 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'yatube.metrics.InstrumentedDjangoTemplates',
         "DIRS": [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -87,11 +91,45 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
 DATABASES = {
+    # yatube.db: SQLite с PRAGMA на каждом соединении и очередью на
+    # запись внутри процесса, см. yatube/db/base.py
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'yatube.db',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-    }
+        'OPTIONS': {
+            # busy timeout, секунды
+            'timeout': 20,
+        },
+        'PRAGMAS': {
+            # читатели не ждут писателя, писатель не ждёт читателей
+            'journal_mode': 'WAL',
+            # в режиме WAL NORMAL не теряет целостность при сбое
+            'synchronous': 'NORMAL',
+            'mmap_size': 256 * 1024 * 1024,
+            # отрицательное значение - в килобайтах
+            'cache_size': -64 * 1024,
+            'temp_store': 'MEMORY',
+        },
+    },
+    # Локальная реплика: копия основной базы, которую обновляет
+    # команда replicate_db (yatube.routers)
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
 }
+DATABASE_ROUTERS = ['yatube.routers.PrimaryReplicaRouter']
+
+# Псевдонимы баз, с которых читают GET-запросы. Пусто - всё читается
+# из основной базы. Например: YATUBE_REPLICAS=replica
+REPLICA_DATABASES = [
+    alias for alias in os.environ.get("YATUBE_REPLICAS", "").split(",")
+    if alias
+]
+# После записи запросы пользователя столько секунд читают из основной базы
+REPLICA_PIN_SECONDS = 10
+REPLICA_PIN_COOKIE = "primary_until"
 
 
 # Password validation
@@ -149,10 +187,112 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 SITE_ID = 1
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Версии posts.versions, копии страниц и фрагменты ленты живут в кэше.
+# LocMemCache у каждого процесса свой: изменение, сделанное в одном
+# воркере, другие не видят, поэтому с ним TTL короткие. Для нескольких
+# воркеров нужен общий memcached, например YATUBE_MEMCACHED=127.0.0.1:11211
+MEMCACHED_LOCATION = os.environ.get("YATUBE_MEMCACHED")
+SHARED_CACHE = bool(MEMCACHED_LOCATION)
+
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+            'LOCATION': MEMCACHED_LOCATION.split(","),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 # django.core.cache.backends.locmem.LocMemCache
 # django.core.cache.backends.dummy.DummyCache
+
+# Лента подписок (posts.timeline)
+# авторы с таким числом подписчиков и больше не раскладываются по лентам
+TIMELINE_FANOUT_LIMIT = 10000
+# ниже этого числа подписчиков автор возвращается к раскладке по лентам
+# (команда release_pulled_authors); запас не даёт переключаться туда и
+# обратно, когда число подписчиков колеблется у TIMELINE_FANOUT_LIMIT
+TIMELINE_RELEASE_LIMIT = 8000
+# сколько последних постов автора попадает в ленту при подписке
+TIMELINE_BACKFILL_LIMIT = 1000
+TIMELINE_BATCH_SIZE = 500
+
+# Сколько секунд хранится число записей для постраничного вывода
+PAGINATOR_COUNT_TIMEOUT = 300
+# Сколько первых страниц ленты нумеруется; дальше ссылки идут по курсору
+PAGINATOR_OFFSET_PAGES = 5
+
+# Комментариев на одной странице поста (подгружаются по курсору)
+COMMENTS_PER_PAGE = 20
+
+# Сколько секунд обратный прокси может отдавать анонимам страницы ленты,
+# групп, профилей и постов без проверки (posts.conditional)
+PAGE_PROXY_MAX_AGE = 10
+
+# Время жизни страниц в кэше для анонимов (posts.pagecache); копия
+# сбрасывается раньше, как только меняется версия её содержимого.
+# Без общего кэша - не дольше 20 секунд, см. SHARED_CACHE
+PAGE_CACHE_TIMEOUT = 60 * 10 if SHARED_CACHE else 20
+
+# Записей в RSS/Atom лентах (posts.feeds)
+SYNDICATION_ITEMS = 20
+
+# Время жизни фрагментов ленты, инвалидируемых по версии (posts.versions);
+# без общего кэша - 20 секунд, как было до версий
+FEED_CACHE_TIMEOUT = 60 * 60 if SHARED_CACHE else 20
+
+# Время жизни версий и времени изменения (posts.versions). В кэше
+# процесса они не видят изменений, сделанных другими процессами, поэтому
+# без общего кэша живут 20 секунд: дольше ETag и Last-Modified
+# (posts.conditional) не могут отвечать 304 по устаревшей странице
+VERSION_CACHE_TIMEOUT = None if SHARED_CACHE else 20
+
+# Бюджеты запроса для yatube.metrics: превышение пишется в лог.
+# Ключ - имя url (index, profile, post, ...), "default" - для всех
+METRICS_BUDGETS = {
+    "default": {
+        "sql_queries": 30,
+        "sql_duration_seconds": 0.1,
+        "template_duration_seconds": 0.2,
+        "request_duration_seconds": 0.5,
+    },
+}
+
+# Миниатюры постов (posts.thumbnails): создаются заранее в пуле
+# воркеров после загрузки изображения.
+# Вид пула: "thread", "process" или "sync" (сразу в текущем потоке)
+POST_THUMBNAILS = {
+    "card": ("960x339", {"crop": "center", "upscale": True}),
+}
+# Для каждого вида создаются варианты меньшей ширины в каждом из форматов
+# POST_THUMBNAIL_FORMATS; последний формат - запасной для <img>
+POST_THUMBNAIL_WIDTHS = (320, 480, 640, 800, 960)
+POST_THUMBNAIL_FORMATS = ("WEBP", "JPEG")
+POST_THUMBNAIL_WORKER_KIND = "thread"
+POST_THUMBNAIL_WORKERS = 2
+
+# Метаданные миниатюр: LRU в памяти процесса перед кэшем и базой
+THUMBNAIL_KVSTORE = 'posts.kvstore.KVStore'
+POST_THUMBNAIL_LRU_SIZE = 2048
+# Сколько секунд помнить, что миниатюры ещё нет: её может создать
+# воркер в другом процессе
+POST_THUMBNAIL_MISS_TIMEOUT = 5
+
+# Приём изображений постов (posts.ingest): ограничения проверяются до
+# декодирования, перекодирование выполняется в пуле процессов.
+# POST_IMAGE_WORKER_KIND: "process" или "sync"
+POST_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+POST_IMAGE_MAX_PIXELS = 40 * 1000 * 1000
+POST_IMAGE_MAX_SIDE = 1920
+POST_IMAGE_FORMAT = "JPEG"
+POST_IMAGE_QUALITY = 85
+POST_IMAGE_WORKER_KIND = "process"
+POST_IMAGE_WORKERS = 2
+
+# Выгрузка постов и комментариев (posts.export): строк за одно чтение
+# из курсора базы
+EXPORT_CHUNK_SIZE = 2000
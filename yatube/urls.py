@@ -19,11 +19,14 @@ from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .metrics import metrics
+
 handler404 = "posts.views.page_not_found"
 handler500 = "posts.views.server_error"
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics/", metrics, name="metrics"),
     path("", include("posts.urls")),
     path("auth/", include("users.urls")),
     path("auth/", include("django.contrib.auth.urls")),